@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+"""Offline benchmarks of the wos client against the mock WOS services (see
+mockserver.py), run in a child process.
+
+    python benchmarks/bench.py --records 5000 --json results.json
+    python benchmarks/bench.py --baseline results.json
+
+Every benchmark is timed over --repeat runs (the median is reported), then run
+once more under tracemalloc for the memory high-water mark. The latency
+percentiles are the ones of the API calls (see wos.metrics). With --baseline
+the exit status is 1 if any benchmark is slower than the baseline by more than
+--tolerance. The clients are not throttled."""
+
+from argparse import ArgumentParser
+import os.path
+import tempfile
+import shutil
+import json
+import time
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mockserver import Subprocess, client_class, doi  # noqa: E402
+from wos.metrics import Collector  # noqa: E402
+from wos import utils  # noqa: E402
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+clock = getattr(time, 'perf_counter', time.time)
+
+QUERY = 'TS=(synthetic)'
+
+MODES = {
+    'suds': {},
+    'fast': {'fast': True},
+    'lite': {'lite': True},
+    'lite-fast': {'lite': True, 'fast': True},
+}
+
+
+def bench_pages(client, n):
+    """search/retrieve pagination, streaming the REC elements."""
+    return sum(1 for _ in utils.iter_records(client, QUERY, n, limit=100))
+
+
+def bench_wosrecords(client, n):
+    """Pagination extracting the WosRecord fields."""
+    return sum(1 for _ in utils.iter_wosrecords(client, QUERY, n, limit=100))
+
+
+def bench_query(client, n):
+    """utils.query merging all the pages (no XPath, not prettified)."""
+    utils.query(client, QUERY, None, n, pretty=False)
+    return n
+
+
+def bench_query_xpath(client, n):
+    """utils.query with an XPath query on every page."""
+    path = './records/uid' if client.is_lite() else './REC/UID'
+    return len(utils.query(client, QUERY, path, n))
+
+
+def bench_single(client, n):
+    """utils.single prettifying pages of 100 records."""
+    for offset in range(1, n + 1, 100):
+        utils.single(client, QUERY, count=min(100, n - offset + 1),
+                     offset=offset)
+    return n
+
+
+def bench_doi(client, n):
+    """doi_to_wos, one query per DOI (at most 100 DOIs)."""
+    count = min(n, 100)
+    for i in range(1, count + 1):
+        utils.doi_to_wos(client, doi(i))
+    return count
+
+
+def bench_doi_many(client, n):
+    """doi_to_wos_many, packing the DOIs in OR'ed queries."""
+    resolved, _, _ = utils.doi_to_wos_many(
+        client, [doi(i) for i in range(1, n + 1)])
+    return len(resolved)
+
+
+BENCHMARKS = [
+    ('pages', bench_pages, MODES),
+    ('wosrecords', bench_wosrecords, MODES),
+    ('query', bench_query, MODES),
+    ('query-xpath', bench_query_xpath, MODES),
+    ('single', bench_single, MODES),
+    ('doi', bench_doi, ('suds', 'fast')),
+    ('doi-many', bench_doi_many, ('suds', 'fast')),
+]
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of the values."""
+    values = sorted(values)
+    if not values:
+        return 0.0
+    rank = int(round(p * len(values))) - 1
+    return values[min(len(values) - 1, max(0, rank))]
+
+
+def connect(client):
+    """Connect the client without printing the SID."""
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        client.connect()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def measure(run, repeat):
+    """Time run() repeat times and once more under tracemalloc. Return the
+    median seconds, the records and the peak memory (bytes)."""
+    times, records, peak = [], None, None
+    for _ in range(repeat):
+        start = clock()
+        records = run()
+        times.append(clock() - start)
+    if tracemalloc:
+        tracemalloc.start()
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return percentile(times, 0.5), records, peak
+
+
+def run_benchmarks(url, args, wsdl_cache):
+    """Run the API benchmarks and yield their results."""
+    MockWosClient = client_class(url)
+    for name, fn, modes in BENCHMARKS:
+        for mode in modes:
+            if args.only and not any(only in '%s/%s' % (name, mode)
+                                     for only in args.only):
+                continue
+            collector = Collector()
+            client = MockWosClient(throttle=None, wsdl_cache=wsdl_cache,
+                                   observer=collector, **MODES[mode])
+            connect(client)
+            try:
+                seconds, records, peak = measure(
+                    lambda: fn(client, args.records), args.repeat)
+            finally:
+                client.close()
+            latencies = [stats.total for calls in collector._calls.values()
+                         for stats in calls]
+            yield '%s/%s' % (name, mode), {
+                'seconds': seconds,
+                'records': records,
+                'records_per_s': records / seconds if seconds else 0.0,
+                'peak_mb': peak / 1e6 if peak is not None else None,
+                'calls': len(latencies),
+                'p50_ms': percentile(latencies, 0.5) * 1000,
+                'p90_ms': percentile(latencies, 0.9) * 1000,
+                'p99_ms': percentile(latencies, 0.99) * 1000,
+            }
+
+
+def run_startup(url, args, wsdl_cache):
+    """Benchmark the creation and the authentication of the clients: without
+    the WSDL cache (cold), with the WSDL cache (warm) and the fast transport.
+    """
+    MockWosClient = client_class(url)
+    cases = [('cold', {'wsdl_cache': False}),
+             ('warm', {'wsdl_cache': wsdl_cache}),
+             ('fast', {'fast': True})]
+    MockWosClient(wsdl_cache=wsdl_cache)  # fill the WSDL cache
+    for case, kwargs in cases:
+        if args.only and not any(only in 'startup/' + case
+                                 for only in args.only):
+            continue
+
+        def run():
+            client = MockWosClient(throttle=None, **kwargs)
+            connect(client)
+            client.close()
+            return 1
+
+        times = []
+        for _ in range(max(args.repeat, 5)):
+            start = clock()
+            run()
+            times.append(clock() - start)
+        _, _, peak = measure(run, 0)
+        yield 'startup/' + case, {
+            'seconds': percentile(times, 0.5),
+            'records': 0,
+            'records_per_s': 0.0,
+            'peak_mb': peak / 1e6 if peak is not None else None,
+            'calls': len(times),
+            'p50_ms': percentile(times, 0.5) * 1000,
+            'p90_ms': percentile(times, 0.9) * 1000,
+            'p99_ms': percentile(times, 0.99) * 1000,
+        }
+
+
+def report(name, result, file=sys.stdout):
+    peak = result['peak_mb']
+    file.write('%-22s %9.3f %11.0f %9s %6d %9.2f %9.2f %9.2f\n' % (
+        name, result['seconds'], result['records_per_s'],
+        '%.1f' % peak if peak is not None else '-', result['calls'],
+        result['p50_ms'], result['p90_ms'], result['p99_ms']))
+    file.flush()
+
+
+def compare(results, baseline, tolerance):
+    """Names of the benchmarks slower than the baseline by more than the
+    tolerance (fraction)."""
+    return [name for name, result in sorted(results.items())
+            if name in baseline and
+            result['seconds'] > baseline[name]['seconds'] * (1 + tolerance)]
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark the wos client offline.')
+    parser.add_argument('-n', '--records', type=int, default=2000,
+                        help='records found by every query')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='timed runs of every benchmark')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds of latency of the mock services')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='random seconds added to the latency')
+    parser.add_argument('--only', nargs='*', default=None,
+                        help='run only the benchmarks containing these names')
+    parser.add_argument('--json', type=str, default=None,
+                        help='save the results to this file')
+    parser.add_argument('--baseline', type=str, default=None,
+                        help='compare the results with this file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='slowdown tolerated by --baseline')
+    args = parser.parse_args()
+
+    sys.stdout.write('%-22s %9s %11s %9s %6s %9s %9s %9s\n' % (
+        'benchmark', 'seconds', 'records/s', 'peak MB', 'calls', 'p50 ms',
+        'p90 ms', 'p99 ms'))
+    results = {}
+    wsdl_cache = tempfile.mkdtemp(prefix='wos-bench-')
+    try:
+        with Subprocess(args.records, args.latency, args.jitter) as url:
+            for run in (run_startup, run_benchmarks):
+                for name, result in run(url, args, wsdl_cache):
+                    results[name] = result
+                    report(name, result)
+    finally:
+        shutil.rmtree(wsdl_cache, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            slower = compare(results, json.load(baseline), args.tolerance)
+        for name in slower:
+            sys.stderr.write('REGRESSION: %s\n' % name)
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,468 @@
+#!/usr/bin/env python
+"""Mock of the Web of Science web services for offline benchmarks.
+
+Implements the WOKMWSAuthenticate (authenticate, closeSession), WokSearch and
+WokSearchLite (search, retrieve, retrieveById) operations over synthetic
+result sets of configurable size, with an optional latency per request. The
+minimal WSDLs needed by suds are served at the usual ?wsdl URLs.
+
+    python benchmarks/mockserver.py --port 8000 --records 10000
+
+Queries are answered with the first `records` synthetic records, except for
+the DO=... and UT=... queries, answered with the records having those DOIs or
+UIDs (the DOI of the record n is 10.1000/bench.n and its UID
+WOS:00000000000000n). The timeSpan of the searches is honored (the record n is
+published on the day n // 30 of the year 1990 + n % 30)."""
+
+from xml.sax.saxutils import escape
+from xml.etree import ElementTree as ET
+from argparse import ArgumentParser
+import subprocess
+import threading
+import itertools
+import datetime
+import random
+import time
+import sys
+import re
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+AUTH_PATH = '/esti/wokmws/ws/WOKMWSAuthenticate'
+SEARCH_PATH = '/esti/wokmws/ws/WokSearch'
+SEARCHLITE_PATH = '/esti/wokmws/ws/WokSearchLite'
+
+_NS = {
+    AUTH_PATH: 'http://auth.cxf.wokmws.thomsonreuters.com',
+    SEARCH_PATH: 'http://woksearch.v3.wokmws.thomsonreuters.com',
+    SEARCHLITE_PATH: 'http://woksearchlite.v3.wokmws.thomsonreuters.com',
+}
+
+_FULLRECORD_NS = ('http://scientific.thomsonreuters.com/schema/wok5.4/public/'
+                  'FullRecord')
+
+_DOI = re.compile(r'10\.1000/bench\.(\d+)', re.I)
+_UT = re.compile(r'(?:WOS:)?(\d{6,})', re.I)
+
+
+# ---------------------------------------------------------------- WSDLs
+
+_WSDL = '''<?xml version="1.0" encoding="UTF-8"?>
+<definitions xmlns="http://schemas.xmlsoap.org/wsdl/"
+    xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/"
+    xmlns:xs="http://www.w3.org/2001/XMLSchema" xmlns:tns="{ns}"
+    targetNamespace="{ns}" name="{name}Service">
+  <types>
+    <xs:schema targetNamespace="{ns}" elementFormDefault="unqualified">
+{types}
+    </xs:schema>
+  </types>
+{messages}
+  <portType name="{name}">
+{ports}
+  </portType>
+  <binding name="{name}ServiceSoapBinding" type="tns:{name}">
+    <soap:binding style="document"
+        transport="http://schemas.xmlsoap.org/soap/http"/>
+{bindings}
+  </binding>
+  <service name="{name}Service">
+    <port name="{name}Port" binding="tns:{name}ServiceSoapBinding">
+      <soap:address location="{location}"/>
+    </port>
+  </service>
+</definitions>
+'''
+
+_AUTH_TYPES = '''
+<xs:element name="authenticate"><xs:complexType><xs:sequence/>
+  </xs:complexType></xs:element>
+<xs:element name="authenticateResponse"><xs:complexType><xs:sequence>
+  <xs:element name="return" type="xs:string" minOccurs="0"/>
+  </xs:sequence></xs:complexType></xs:element>
+<xs:element name="closeSession"><xs:complexType><xs:sequence/>
+  </xs:complexType></xs:element>
+<xs:element name="closeSessionResponse"><xs:complexType><xs:sequence/>
+  </xs:complexType></xs:element>
+'''
+
+_SEARCH_TYPES = '''
+<xs:complexType name="editionDesc"><xs:sequence>
+  <xs:element name="collection" type="xs:string"/>
+  <xs:element name="edition" type="xs:string"/>
+  </xs:sequence></xs:complexType>
+<xs:complexType name="timeSpan"><xs:sequence>
+  <xs:element name="begin" type="xs:string"/>
+  <xs:element name="end" type="xs:string"/>
+  </xs:sequence></xs:complexType>
+<xs:complexType name="queryParameters"><xs:sequence>
+  <xs:element name="databaseId" type="xs:string"/>
+  <xs:element name="userQuery" type="xs:string"/>
+  <xs:element name="editions" type="tns:editionDesc" minOccurs="0"
+      maxOccurs="unbounded"/>
+  <xs:element name="symbolicTimeSpan" type="xs:string" minOccurs="0"/>
+  <xs:element name="timeSpan" type="tns:timeSpan" minOccurs="0"/>
+  <xs:element name="queryLanguage" type="xs:string"/>
+  </xs:sequence></xs:complexType>
+<xs:complexType name="sortField"><xs:sequence>
+  <xs:element name="name" type="xs:string"/>
+  <xs:element name="sort" type="xs:string" minOccurs="0"/>
+  </xs:sequence></xs:complexType>
+<xs:complexType name="retrieveParameters"><xs:sequence>
+  <xs:element name="firstRecord" type="xs:int"/>
+  <xs:element name="count" type="xs:int"/>
+  <xs:element name="sortField" type="tns:sortField" minOccurs="0"
+      maxOccurs="unbounded"/>
+  </xs:sequence></xs:complexType>
+<xs:complexType name="searchResults"><xs:sequence>
+  <xs:element name="queryId" type="xs:string" minOccurs="0"/>
+  <xs:element name="recordsFound" type="xs:int"/>
+  <xs:element name="recordsSearched" type="xs:long"/>
+  <xs:element name="records" type="xs:string" minOccurs="0"/>
+  </xs:sequence></xs:complexType>
+<xs:complexType name="recordData"><xs:sequence>
+  <xs:element name="records" type="xs:string" minOccurs="0"/>
+  </xs:sequence></xs:complexType>
+<xs:element name="search"><xs:complexType><xs:sequence>
+  <xs:element name="queryParameters" type="tns:queryParameters"/>
+  <xs:element name="retrieveParameters" type="tns:retrieveParameters"/>
+  </xs:sequence></xs:complexType></xs:element>
+<xs:element name="searchResponse"><xs:complexType><xs:sequence>
+  <xs:element name="return" type="tns:searchResults"/>
+  </xs:sequence></xs:complexType></xs:element>
+<xs:element name="retrieve"><xs:complexType><xs:sequence>
+  <xs:element name="queryId" type="xs:string"/>
+  <xs:element name="retrieveParameters" type="tns:retrieveParameters"/>
+  </xs:sequence></xs:complexType></xs:element>
+<xs:element name="retrieveResponse"><xs:complexType><xs:sequence>
+  <xs:element name="return" type="tns:recordData"/>
+  </xs:sequence></xs:complexType></xs:element>
+<xs:element name="retrieveById"><xs:complexType><xs:sequence>
+  <xs:element name="databaseId" type="xs:string"/>
+  <xs:element name="uid" type="xs:string" maxOccurs="unbounded"/>
+  <xs:element name="queryLanguage" type="xs:string"/>
+  <xs:element name="retrieveParameters" type="tns:retrieveParameters"/>
+  </xs:sequence></xs:complexType></xs:element>
+<xs:element name="retrieveByIdResponse"><xs:complexType><xs:sequence>
+  <xs:element name="return" type="tns:searchResults"/>
+  </xs:sequence></xs:complexType></xs:element>
+'''
+
+_SERVICES = {
+    AUTH_PATH: ('WOKMWSAuthenticate', _AUTH_TYPES,
+                ('authenticate', 'closeSession')),
+    SEARCH_PATH: ('WokSearch', _SEARCH_TYPES,
+                  ('search', 'retrieve', 'retrieveById')),
+    SEARCHLITE_PATH: ('WokSearchLite', _SEARCH_TYPES,
+                      ('search', 'retrieve', 'retrieveById')),
+}
+
+
+def wsdl(path, location):
+    """WSDL of the service at path, with the endpoint at location."""
+    name, types, operations = _SERVICES[path]
+    messages = ''.join(
+        '  <message name="{0}{1}"><part name="parameters" '
+        'element="tns:{0}{1}"/></message>\n'.format(op, suffix)
+        for op in operations for suffix in ('', 'Response'))
+    ports = ''.join(
+        '    <operation name="{0}"><input message="tns:{0}"/>'
+        '<output message="tns:{0}Response"/></operation>\n'.format(op)
+        for op in operations)
+    bindings = ''.join(
+        '    <operation name="{0}"><soap:operation soapAction=""/>'
+        '<input><soap:body use="literal"/></input>'
+        '<output><soap:body use="literal"/></output></operation>\n'.format(op)
+        for op in operations)
+    return _WSDL.format(ns=_NS[path], name=name, types=types,
+                        messages=messages, ports=ports, bindings=bindings,
+                        location=location)
+
+
+# ---------------------------------------------------------------- records
+
+def uid(n):
+    """UID of the synthetic record n."""
+    return 'WOS:%015d' % n
+
+
+def doi(n):
+    """DOI of the synthetic record n."""
+    return '10.1000/bench.%d' % n
+
+
+def published(n):
+    """Publication date (YYYY-MM-DD) of the synthetic record n."""
+    return (datetime.date(1990 + n % 30, 1, 1) +
+            datetime.timedelta(days=(n // 30) % 365)).isoformat()
+
+
+def premium_record(n, references=10):
+    """Synthetic premium REC of the record n."""
+    authors = ''.join(
+        '<name role="author" seq_no="%d"><display_name>Author %d-%d'
+        '</display_name><wos_standard>Author, %d%d</wos_standard></name>'
+        % (i, n, i, n, i) for i in range(1, 4))
+    refs = ''.join('<ref><uid>%s</uid><year>2000</year></ref>' % uid(n + i)
+                   for i in range(1, references + 1))
+    return (
+        '<REC r_id_disclaimer="Synthetic record"><UID>%(uid)s</UID>'
+        '<static_data><summary><pub_info pubyear="%(year)d" vol="%(vol)d" '
+        'pubtype="Journal"/><titles count="2">'
+        '<title type="source">JOURNAL %(journal)d</title>'
+        '<title type="item">Synthetic article number %(n)d about things'
+        '</title></titles><names count="3">%(authors)s</names></summary>'
+        '<fullrecord_metadata><refs count="%(refs_count)d">%(refs)s</refs>'
+        '<abstracts><abstract><abstract_text><p>%(abstract)s</p>'
+        '</abstract_text></abstract></abstracts></fullrecord_metadata>'
+        '</static_data><dynamic_data><citation_related><tc_list>'
+        '<silo_tc coll_id="WOS" local_count="%(tc)d"/></tc_list>'
+        '</citation_related><cluster_related><identifiers>'
+        '<identifier type="issn" value="1234-%(issn)04d"/>'
+        '<identifier type="doi" value="%(doi)s"/></identifiers>'
+        '</cluster_related></dynamic_data></REC>' % {
+            'uid': uid(n), 'n': n, 'year': 1990 + n % 30, 'vol': n % 50,
+            'journal': n % 100, 'authors': authors, 'refs': refs,
+            'refs_count': references, 'tc': n % 997, 'issn': n % 10000,
+            'doi': doi(n), 'abstract': 'Lorem ipsum dolor sit amet. ' * 20})
+
+
+def lite_record(n):
+    """Synthetic WOS lite records element of the record n."""
+    def field(tag, label, *values):
+        return '<%s><label>%s</label>%s</%s>' % (
+            tag, label, ''.join('<value>%s</value>' % escape(value)
+                                for value in values), tag)
+    return ('<records><uid>%s</uid>%s%s%s%s%s</records>' % (
+        uid(n),
+        field('title', 'Title', 'Synthetic article number %d' % n),
+        field('source', 'SourceTitle', 'JOURNAL %d' % (n % 100)),
+        field('source', 'Published.BiblioYear', str(1990 + n % 30)),
+        field('authors', 'Authors', *['Author, %d%d' % (n, i)
+                                      for i in range(1, 4)]),
+        field('other', 'Identifier.Doi', doi(n))))
+
+
+# ---------------------------------------------------------------- service
+
+_ENVELOPE = ('<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/'
+             'envelope/"><soap:Body>%s</soap:Body></soap:Envelope>')
+
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+class MockService(object):
+    """State of the mock services: the synthetic records (rendered on first
+    use) and the result sets of the queries."""
+
+    def __init__(self, records=1000, latency=0.0, jitter=0.0, references=10):
+        self.records = records
+        self.latency = latency
+        self.jitter = jitter
+        self.references = references
+        self._premium = {}
+        self._lite = {}
+        self._queries = {}
+        self._ids = itertools.count(1)
+        self._sessions = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _render(self, numbers, lite):
+        cache = self._lite if lite else self._premium
+        for n in numbers:
+            if n not in cache:
+                cache[n] = (lite_record(n) if lite else
+                            premium_record(n, self.references))
+        return ''.join(cache[n] for n in numbers)
+
+    def _results(self, path, name, numbers, first, count, query_id=None):
+        """Response element with the page [first, first + count) of the
+        result set (and the summary if query_id is given)."""
+        lite = path == SEARCHLITE_PATH
+        page = self._render(numbers[first - 1:first - 1 + count], lite)
+        if not lite:
+            page = escape('<records xmlns="%s">%s</records>' % (
+                _FULLRECORD_NS, page)) if page else ''
+            page = '<records>%s</records>' % page if page else ''
+        summary = '' if query_id is None else (
+            '<queryId>%s</queryId><recordsFound>%d</recordsFound>'
+            '<recordsSearched>%d</recordsSearched>' % (
+                query_id, len(numbers), 10 * self.records))
+        return '<ns2:%sResponse xmlns:ns2="%s"><return>%s%s</return>' \
+               '</ns2:%sResponse>' % (name, _NS[path], summary, page, name)
+
+    def _query(self, user_query, begin=None, end=None):
+        """Record numbers matching the query (published between begin and
+        end, if given)."""
+        if user_query.strip().upper().startswith('DO='):
+            numbers = sorted(set(n for n in map(int, _DOI.findall(user_query))
+                                 if 1 <= n <= self.records))
+        elif user_query.strip().upper().startswith('UT='):
+            numbers = sorted(set(n for n in map(int, _UT.findall(user_query))
+                                 if 1 <= n <= self.records))
+        else:
+            numbers = range(1, self.records + 1)
+        if begin or end:
+            numbers = [n for n in numbers
+                       if (begin or '') <= published(n) <= (end or '9999')]
+        return numbers
+
+    def handle(self, path, body):
+        """Answer the SOAP request body sent to the service at path."""
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+        op = list(ET.fromstring(body).find(
+            '{http://schemas.xmlsoap.org/soap/envelope/}Body'))[0]
+        name = _local(op.tag)
+        params = dict((_local(el.tag), el.text) for el in op.iter())
+
+        if name == 'authenticate':
+            return ('<ns2:authenticateResponse xmlns:ns2="%s"><return>'
+                    'BENCH%d</return></ns2:authenticateResponse>' % (
+                        _NS[path], next(self._sessions)))
+        if name == 'closeSession':
+            return ('<ns2:closeSessionResponse xmlns:ns2="%s"/>' % _NS[path])
+
+        first = int(params.get('firstRecord') or 1)
+        count = int(params.get('count') or 0)
+        if name == 'search':
+            numbers = list(self._query(params.get('userQuery') or '',
+                                       params.get('begin'),
+                                       params.get('end')))
+            with self._lock:
+                query_id = str(next(self._ids))
+                self._queries[query_id] = numbers
+            return self._results(path, name, numbers, first, count, query_id)
+        if name == 'retrieve':
+            numbers = self._queries.get(params.get('queryId'))
+            if numbers is None:
+                raise KeyError('Invalid query ID')
+            return self._results(path, name, numbers, first, count)
+        if name == 'retrieveById':
+            numbers = [int(el.text.rsplit(':', 1)[-1]) for el in op.iter()
+                       if _local(el.tag) == 'uid' and el.text]
+            numbers = [n for n in numbers if 1 <= n <= self.records]
+            return self._results(path, name, numbers, first, count, '0')
+        raise KeyError('Unknown operation %s' % name)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately: avoid the delayed ACK stalls
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body, content_type='text/xml; charset=utf-8'):
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path not in _SERVICES:
+            return self._reply(404, 'Not found', 'text/plain')
+        location = 'http://%s:%d%s' % (self.server.server_address[:2] + (
+            path,))
+        self._reply(200, wsdl(path, location))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        path = self.path.split('?', 1)[0]
+        try:
+            self._reply(200, _ENVELOPE % self.server.service.handle(path,
+                                                                    body))
+        except Exception as error:
+            self._reply(500, _ENVELOPE % (
+                '<soap:Fault><faultcode>soap:Server</faultcode><faultstring>'
+                '%s</faultstring></soap:Fault>' % escape(str(error))))
+
+
+class MockServer(ThreadingMixIn, HTTPServer):
+    """Threaded HTTP server of the mock services.
+
+       server = MockServer(records=10000)
+       threading.Thread(target=server.serve_forever).start()"""
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, **kwargs):
+        HTTPServer.__init__(self, (host, port), _Handler)
+        self.service = MockService(**kwargs)
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address[:2]
+
+
+def client_class(url):
+    """Subclass of WosClient connecting to the services at url."""
+    from wos import WosClient
+    return type('MockWosClient', (WosClient,), {
+        'base_url': url,
+        'auth_url': url + AUTH_PATH + '?wsdl',
+        'search_url': url + SEARCH_PATH + '?wsdl',
+        'searchlite_url': url + SEARCHLITE_PATH + '?wsdl'})
+
+
+class Subprocess(object):
+    """Run the mock server in a child process (so that it does not compete
+    with the benchmarked client for the GIL).
+
+       with Subprocess(records=10000) as url:
+           client = client_class(url)(...)"""
+
+    def __init__(self, records=1000, latency=0.0, jitter=0.0, references=10):
+        self.args = ['--records', str(records), '--latency', str(latency),
+                     '--jitter', str(jitter), '--references', str(references)]
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, __file__, '--port', '0'] + self.args,
+            stdout=subprocess.PIPE, universal_newlines=True)
+        return self.process.stdout.readline().split()[-1]
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        self.process.wait()
+        self.process.stdout.close()
+
+
+def main():
+    parser = ArgumentParser(description='Mock Web of Science services.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('-n', '--records', type=int, default=1000,
+                        help='records found by every query')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds added to every request')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='random seconds added to the latency')
+    parser.add_argument('--references', type=int, default=10,
+                        help='cited references per record')
+    args = parser.parse_args()
+    server = MockServer(args.host, args.port, records=args.records,
+                        latency=args.latency, jitter=args.jitter,
+                        references=args.references)
+    print('Serving the mock WOS services on %s' % server.url)
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+"""Startup benchmarks of the wos package and of the wos command line tool,
+every run in a new interpreter (the mock WOS services of mockserver.py are run
+in a child process for the commands talking to the services).
+
+    python benchmarks/startup.py --json startup.json
+    python benchmarks/startup.py --baseline startup.json
+
+The commands use a temporary cache directory (XDG_CACHE_HOME) for the parsed
+WSDLs and the session file, both filled by an untimed warm-up run. With
+--baseline the exit status is 1 if any benchmark is slower than the baseline
+by more than --tolerance."""
+
+from argparse import ArgumentParser
+import subprocess
+import os.path
+import tempfile
+import shutil
+import json
+import time
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mockserver import AUTH_PATH, SEARCH_PATH, SEARCHLITE_PATH  # noqa: E402
+from mockserver import Subprocess  # noqa: E402
+from bench import compare, percentile  # noqa: E402
+
+clock = getattr(time, 'perf_counter', time.time)
+
+SCRIPT = os.path.join(ROOT, 'scripts', 'wos')
+
+# Run the wos script against the mock services at {url}
+MOCK_SCRIPT = '''
+import sys, runpy, wos.client
+wos.client.WosClient.base_url = {url!r}
+wos.client.WosClient.auth_url = {url!r} + {auth!r} + '?wsdl'
+wos.client.WosClient.search_url = {url!r} + {search!r} + '?wsdl'
+wos.client.WosClient.searchlite_url = {url!r} + {searchlite!r} + '?wsdl'
+sys.argv = ['wos'] + sys.argv[1:]
+runpy.run_path({script!r}, run_name='__main__')
+'''
+
+IMPORTS = [
+    ('python', 'pass'),
+    ('import-wos', 'import wos'),
+    ('import-client', 'from wos import WosClient'),
+    ('import-utils', 'import wos.utils'),
+]
+
+# (name, arguments of the wos command, whether to forget the session first)
+COMMANDS = [
+    ('wos-help', ['--help'], False),
+    ('wos-connect', ['connect'], True),
+    ('wos-connect-session', ['connect'], False),
+    ('wos-query', ['query', 'TS=(synthetic)'], False),
+    ('wos-query-fast', ['--fast', 'query', 'TS=(synthetic)'], False),
+    ('wos-close', ['--close'], False),
+]
+
+
+def timed(command, env, repeat, setup=None):
+    """Run the command repeat times (after an untimed warm-up run) and
+    return the seconds of each run."""
+    times = []
+    for run in range(repeat + 1):
+        if setup:
+            setup()
+        start = clock()
+        subprocess.check_call(command, env=env, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE)
+        if run:
+            times.append(clock() - start)
+    return times
+
+
+def run_benchmarks(url, args, env):
+    """Run the startup benchmarks and yield their results."""
+    session = os.path.join(env['XDG_CACHE_HOME'], 'wos', 'session')
+    mock = MOCK_SCRIPT.format(url=url, auth=AUTH_PATH, search=SEARCH_PATH,
+                              searchlite=SEARCHLITE_PATH, script=SCRIPT)
+
+    def forget():
+        if os.path.exists(session):
+            os.remove(session)
+
+    def remember():
+        if not os.path.exists(session):
+            subprocess.check_call([sys.executable, '-c', mock, 'connect'],
+                                  env=env, stdout=subprocess.PIPE)
+
+    cases = [(name, [sys.executable, '-c', code], None)
+             for name, code in IMPORTS]
+    for name, argv, fresh in COMMANDS:
+        command = ([sys.executable, SCRIPT] if name == 'wos-help' else
+                   [sys.executable, '-c', mock])
+        cases.append((name, command + argv, forget if fresh else remember))
+
+    for name, command, setup in cases:
+        if args.only and not any(only in name for only in args.only):
+            continue
+        times = timed(command, env, args.repeat, setup)
+        yield name, {'seconds': percentile(times, 0.5),
+                     'min_ms': min(times) * 1000,
+                     'p50_ms': percentile(times, 0.5) * 1000,
+                     'p90_ms': percentile(times, 0.9) * 1000}
+
+
+def report(name, result, file=sys.stdout):
+    file.write('%-22s %9.1f %9.1f %9.1f\n' % (
+        name, result['min_ms'], result['p50_ms'], result['p90_ms']))
+    file.flush()
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark the startup of wos.')
+    parser.add_argument('-r', '--repeat', type=int, default=10,
+                        help='timed runs of every benchmark')
+    parser.add_argument('--only', nargs='*', default=None,
+                        help='run only the benchmarks containing these names')
+    parser.add_argument('--json', type=str, default=None,
+                        help='save the results to this file')
+    parser.add_argument('--baseline', type=str, default=None,
+                        help='compare the results with this file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='slowdown tolerated by --baseline')
+    args = parser.parse_args()
+
+    sys.stdout.write('%-22s %9s %9s %9s\n' % ('benchmark', 'min ms',
+                                              'p50 ms', 'p90 ms'))
+    results = {}
+    cache = tempfile.mkdtemp(prefix='wos-startup-')
+    env = dict(os.environ, XDG_CACHE_HOME=cache, PYTHONPATH=os.pathsep.join(
+        [ROOT] + [p for p in [os.environ.get('PYTHONPATH')] if p]))
+    try:
+        with Subprocess(records=5) as url:
+            for name, result in run_benchmarks(url, args, env):
+                results[name] = result
+                report(name, result)
+    finally:
+        shutil.rmtree(cache, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            slower = compare(results, json.load(baseline), args.tolerance)
+        for name in slower:
+            sys.stderr.write('REGRESSION: %s\n' % name)
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -11,7 +11,8 @@ setup(name='wos',
       version='0.2.7',
       description='Web of Science client using API v3.',
       long_description=long_description,
-      install_requires=['limit'] + suds_install_requires,
+      install_requires=suds_install_requires,
+      extras_require={'parquet': ['pyarrow'], 'npz': ['numpy']},
       url='http://github.com/enricobacis/wos',
       author='Enrico Bacis',
       author_email='enrico.bacis@gmail.com',
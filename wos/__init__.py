@@ -1,6 +1,39 @@
 #!/usr/bin/env python
 
-__all__ = ['WosClient', 'utils']
+__all__ = ['WosClient', 'WosClientPool', 'utils']
 
-from .client import WosClient
-from . import utils
+from importlib import import_module as _import_module
+from sys import version_info as _version_info
+
+# Public names and the modules defining them, imported on first access (PEP
+# 562) so that importing wos does not load suds and the XML parsers
+_LAZY = {
+    'WosClient': ('.client', 'WosClient'),
+    'WosClientPool': ('.pool', 'WosClientPool'),
+    'AsyncWosClient': ('.aio', 'AsyncWosClient'),
+    'utils': ('.utils', None),
+}
+
+if _version_info >= (3, 6):
+    __all__.append('AsyncWosClient')
+
+
+def __getattr__(name):
+    if name not in _LAZY or name not in __all__:
+        raise AttributeError('module %r has no attribute %r' % (__name__,
+                                                                name))
+    module, attr = _LAZY[name]
+    value = _import_module(module, __name__)
+    if attr:
+        value = getattr(value, attr)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+if _version_info < (3, 7):
+    for _name in __all__:
+        __getattr__(_name)
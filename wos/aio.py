@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+__all__ = ['AsyncWosClient']
+
+import asyncio as _asyncio
+import functools as _functools
+from collections import deque as _deque
+from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
+from .client import WosClient as _WosClient
+from .utils import _get_records, _get_summary, _parse
+
+
+class _AsyncThrottle():
+    """Allow at most `calls` requests to start in every `period` seconds,
+    independently of how long each of them takes to complete."""
+
+    def __init__(self, calls, period=1):
+        self._calls = calls
+        self._period = period
+        self._starts = _deque()
+        self._lock = _asyncio.Lock()
+
+    async def wait(self):
+        """Wait until a new request can be started within the budget."""
+        loop = _asyncio.get_event_loop()
+        async with self._lock:
+            while len(self._starts) >= self._calls:
+                delay = self._starts[0] + self._period - loop.time()
+                if delay > 0:
+                    await _asyncio.sleep(delay)
+                else:
+                    self._starts.popleft()
+            self._starts.append(loop.time())
+
+
+def _async(name):
+    """Create an asynchronous version of the WosClient method `name`."""
+    @_functools.wraps(getattr(_WosClient, name))
+    async def _fn(self, *args, **kwargs):
+        return await self._call(name, *args, **kwargs)
+    return _fn
+
+
+class AsyncWosClient():
+    """Query the Web of Science with asyncio, keeping up to `concurrency`
+    requests in flight while obeying the throttle (calls, period) budget.
+    You must provide user and password only to user premium WWS service.
+
+       async with AsyncWosClient() as wos:
+           results = await wos.search(...)"""
+
+    def __init__(self, user=None, password=None, SID=None, close_on_exit=True,
+                 lite=False, proxy=None, timeout=600, throttle=(2, 1),
+                 concurrency=4, **kwargs):
+        """Create the SOAP clients. user and password for premium access.
+        Other keyword arguments (e.g. cache, fast) are passed to WosClient.
+        The clients share an adaptive throttle too, so that the retries of
+        the failed requests stay within the budget and slow it down."""
+        self._client = _WosClient(user, password, SID, False, lite, proxy,
+                                  timeout, throttle=throttle, **kwargs)
+        self._close_on_exit = close_on_exit
+        self._concurrency = concurrency
+        self._throttle = _AsyncThrottle(*throttle) if throttle else None
+        self._executor = _ThreadPoolExecutor(max_workers=concurrency)
+        self._idle = None
+
+    async def __aenter__(self):
+        """Automatically connect when used with 'async with' statements."""
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        """Close connection after closing the 'async with' statement."""
+        if self._close_on_exit:
+            await self.close()
+        self._executor.shutdown(wait=False)
+
+    def is_lite(self):
+        """Returns True if the client is for WOS lite"""
+        return self._client.is_lite()
+
+    async def _run(self, fn, *args, **kwargs):
+        """Run the blocking function in the executor."""
+        loop = _asyncio.get_event_loop()
+        call = _functools.partial(fn, *args, **kwargs)
+        return await loop.run_in_executor(self._executor, call)
+
+    async def _call(self, name, *args, **kwargs):
+        """Invoke the API `name` on an idle client, within the throttle."""
+        if self._idle is None:
+            raise RuntimeError('Session closed. Invoke connect() before.')
+        client = await self._idle.get()
+        try:
+            if self._throttle:
+                await self._throttle.wait()
+            return await self._run(getattr(client, name), *args, **kwargs)
+        finally:
+            self._idle.put_nowait(client)
+
+    async def connect(self):
+        """Authenticate to WOS and set the SID cookie."""
+        sid = await self._run(self._client.connect)
+        self._idle = _asyncio.Queue()
+        for _ in range(self._concurrency):
+            self._idle.put_nowait(self._client.clone())
+        return sid
+
+    async def close(self):
+        """Close the session and release the session seat."""
+        self._idle = None
+        await self._run(self._client.close)
+
+    search = _async('search')
+    retrieve = _async('retrieve')
+    retrieveById = _async('retrieveById')
+    citedReferences = _async('citedReferences')
+    citedReferencesRetrieve = _async('citedReferencesRetrieve')
+    citingArticles = _async('citingArticles')
+    relatedRecords = _async('relatedRecords')
+
+    async def pages(self, wos_query, count=5, offset=1, limit=100):
+        """Search Web of Science once and asynchronously yield the XML records
+        of each page (from offset to count) in order, retrieving up to
+        `concurrency` following pages concurrently."""
+        if count < offset:
+            return
+        result = _parse(await self.search(
+            wos_query, min(limit, count-offset+1), offset))
+        query_id, found = _get_summary(self._client, result)
+        count = min(count, found)
+        if count >= offset:
+            yield _get_records(self._client, result)
+
+        pending = _deque()
+        try:
+            for x in range(offset+limit, count+1, limit):
+                pending.append(_asyncio.ensure_future(
+                    self.retrieve(query_id, min(limit, count-x+1), x)))
+                if len(pending) >= self._concurrency:
+                    yield _get_records(self._client, await pending.popleft())
+            while pending:
+                yield _get_records(self._client, await pending.popleft())
+        finally:
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+
+__all__ = ['Cache', 'MemoryCache', 'SQLiteCache', 'ShelveCache']
+
+from collections import OrderedDict as _OrderedDict
+from hashlib import sha1 as _sha1
+from suds.sudsobject import Factory as _Factory, Object as _Object
+from .utils import _get_summary
+import threading as _threading
+import inspect as _inspect
+import pickle as _pickle
+import sqlite3 as _sqlite3
+import shelve as _shelve
+import time as _time
+
+# APIs consuming a query ID, whose results only make sense in the session
+_SESSION_BOUND = ('retrieve', 'citedReferencesRetrieve')
+
+_MISS = object()
+
+
+def _normalize(value):
+    """Convert the arguments to a hashable and order-independent form."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _normalize(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize(v) for v in value)
+    if isinstance(value, _Object):
+        return _normalize(dict(value))
+    return value
+
+
+def _dump(value):
+    """Convert suds objects to picklable structures."""
+    if isinstance(value, _Object):
+        return ('__suds__', value.__class__.__name__,
+                [(k, _dump(v)) for k, v in value])
+    if isinstance(value, list):
+        return [_dump(v) for v in value]
+    return value
+
+
+def _load(value):
+    """Rebuild the suds objects converted by _dump."""
+    if isinstance(value, tuple) and value and value[0] == '__suds__':
+        return _Factory.object(value[1], _OrderedDict(
+            (k, _load(v)) for k, v in value[2]))
+    if isinstance(value, list):
+        return [_load(v) for v in value]
+    return value
+
+
+def _is_complete(client, response, parameters):
+    """True if the response contains all the records found by the query, so
+    that its query ID will never be used to retrieve further records."""
+    try:
+        found = _get_summary(client, response)[1]
+    except Exception:
+        return False
+    return parameters['firstRecord'] == 1 and found <= parameters['count']
+
+
+class Cache(object):
+    """Base class of the API response caches. Subclasses implement _get,
+    _set, clear and close. The responses scoped to a session are useless
+    once it is closed, so they are kept in memory only (the last
+    scoped_size of them) and never reach the subclasses.
+
+    :ttl: Seconds after which a cached response expires (None for never)
+    """
+
+    scoped_size = 32
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = _threading.RLock()
+        self._scoped = _OrderedDict()
+
+    def stats(self):
+        """Return the hits, misses and hit ratio of the cache."""
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'ratio': float(self.hits) / total if total else 0.0}
+
+    def get(self, key, scoped=False):
+        """Return the cached value for the key (scoped to a session), or
+        _MISS."""
+        with self._lock:
+            if not scoped:
+                entry = self._get(key)
+            else:
+                entry = self._scoped.pop(key, None)
+                if entry is not None:
+                    self._scoped[key] = entry
+        if entry is None or (entry[0] is not None and entry[0] < _time.time()):
+            return _MISS
+        return entry[1]
+
+    def set(self, key, value, scoped=False):
+        """Cache the value for the key (scoped to a session)."""
+        expires = _time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if not scoped:
+                self._set(key, (expires, value))
+                return
+            self._scoped.pop(key, None)
+            self._scoped[key] = (expires, value)
+            while len(self._scoped) > self.scoped_size:
+                self._scoped.popitem(last=False)
+
+    @staticmethod
+    def _callargs(client, fn, args, kwargs):
+        """Bind the arguments of the API call, replacing offset and count with
+        the retrieve parameters they stand for."""
+        fn = getattr(fn, '__wrapped__', fn)
+        callargs = _inspect.getcallargs(fn, client, *args, **kwargs)
+        callargs.pop('self', None)
+        if 'retrieveParameters' in callargs:
+            params = callargs['retrieveParameters']
+            callargs['retrieveParameters'] = (
+                params or client.make_retrieveParameters(
+                    callargs.pop('offset'), callargs.pop('count')))
+        return fn.__name__, callargs
+
+    def call(self, client, fn, args, kwargs, call):
+        """Return the cached response of the API call or invoke call() and
+        cache its result. The key is made of the method name, the access level,
+        the transport (whose responses differ) and the normalized arguments.
+        Responses of APIs consuming a query ID are scoped to the session, and
+        so are the responses carrying a query ID that could still be used to
+        retrieve more records."""
+        name, callargs = self._callargs(client, fn, args, kwargs)
+        key = repr((name, client.is_lite(), client._fast,
+                    _normalize(callargs)))
+        scoped = repr((client._SID, key))
+        value = self.get(key) if name not in _SESSION_BOUND else _MISS
+        if value is _MISS:
+            value = self.get(scoped, True)
+        with self._lock:
+            if value is not _MISS:
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        response = call()
+        parameters = callargs.get('retrieveParameters')
+        if (name not in _SESSION_BOUND and parameters and
+                _is_complete(client, response, parameters)):
+            self.set(key, response)
+        else:
+            self.set(scoped, response, True)
+        return response
+
+
+class MemoryCache(Cache):
+    """In-memory cache evicting the least recently used responses.
+
+    :maxsize: Maximum number of cached responses
+    :ttl: Seconds after which a cached response expires (None for never)
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        super(MemoryCache, self).__init__(ttl)
+        self.maxsize = maxsize
+        self._data = _OrderedDict()
+
+    def _get(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._data[key] = entry
+        return entry
+
+    def _set(self, key, entry):
+        self._data.pop(key, None)
+        self._data[key] = entry
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        """Remove all the cached responses."""
+        with self._lock:
+            self._data.clear()
+            self._scoped.clear()
+
+    def close(self):
+        """Nothing to release for the in-memory cache."""
+
+
+class SQLiteCache(Cache):
+    """On-disk cache backed by an SQLite database.
+
+    :path: Path of the SQLite database file
+    :ttl: Seconds after which a cached response expires (None for never)
+    """
+
+    def __init__(self, path, ttl=None):
+        super(SQLiteCache, self).__init__(ttl)
+        self._db = _sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS cache '
+                         '(key TEXT PRIMARY KEY, expires REAL, value BLOB)')
+        self._db.execute('DELETE FROM cache WHERE expires < ?',
+                         (_time.time(),))
+        self._db.commit()
+
+    @staticmethod
+    def _hash(key):
+        return _sha1(key.encode('utf-8')).hexdigest()
+
+    def _get(self, key):
+        row = self._db.execute('SELECT expires, value FROM cache WHERE key=?',
+                               (self._hash(key),)).fetchone()
+        return row and (row[0], _load(_pickle.loads(row[1])))
+
+    def _set(self, key, entry):
+        value = _pickle.dumps(_dump(entry[1]), _pickle.HIGHEST_PROTOCOL)
+        self._db.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?)',
+                         (self._hash(key), entry[0], _sqlite3.Binary(value)))
+        self._db.commit()
+
+    def clear(self):
+        """Remove all the cached responses."""
+        with self._lock:
+            self._db.execute('DELETE FROM cache')
+            self._db.commit()
+            self._scoped.clear()
+
+    def close(self):
+        """Close the SQLite database."""
+        with self._lock:
+            self._db.close()
+
+
+class ShelveCache(Cache):
+    """On-disk cache backed by a shelve database.
+
+    :path: Path of the shelve database file
+    :ttl: Seconds after which a cached response expires (None for never)
+    """
+
+    def __init__(self, path, ttl=None):
+        super(ShelveCache, self).__init__(ttl)
+        self._shelf = _shelve.open(path)
+        now = _time.time()
+        expired = [key for key, entry in self._shelf.items()
+                   if entry[0] is not None and entry[0] < now]
+        for key in expired:
+            del self._shelf[key]
+        if expired:
+            self._shelf.sync()
+
+    def _get(self, key):
+        entry = self._shelf.get(_sha1(key.encode('utf-8')).hexdigest())
+        return entry and (entry[0], _load(entry[1]))
+
+    def _set(self, key, entry):
+        key = _sha1(key.encode('utf-8')).hexdigest()
+        self._shelf[key] = (entry[0], _dump(entry[1]))
+        self._shelf.sync()
+
+    def clear(self):
+        """Remove all the cached responses."""
+        with self._lock:
+            self._shelf.clear()
+            self._scoped.clear()
+
+    def close(self):
+        """Close the shelve database."""
+        with self._lock:
+            self._shelf.close()
@@ -2,12 +2,68 @@
 
 __all__ = ['WosClient']
 
-import suds as _suds
 import functools as _functools
+import random as _random
+import socket as _socket
+import threading as _threading
+import copy as _copy
+import time as _time
+import os as _os
+import re as _re
 from base64 import b64encode as _b64encode
 from collections import OrderedDict as _OrderedDict
 from sys import version_info as _version_info
-from limit import limit as _limit
+from .throttle import AdaptiveThrottle as _AdaptiveThrottle
+from . import metrics as _metrics
+
+
+# Bump to invalidate the WSDLs cached by previous versions
+_WSDL_CACHE_VERSION = 1
+
+# APIs consuming a query ID, that cannot be retried in a new session
+_SESSION_BOUND = ('retrieve', 'citedReferencesRetrieve')
+
+_SESSION_FAULT = _re.compile(r'(session|SID).*(expired|invalid|not valid|'
+                             r'not found)', _re.I | _re.S)
+_THROTTLE_FAULT = _re.compile(r'throttl|limit.*exceeded|exceeded.*limit'
+                              r'|too many', _re.I | _re.S)
+_SERVER_FAULT = _re.compile(r'internal|unavailable|temporar|timed? ?out',
+                            _re.I | _re.S)
+
+
+def _error_kind(error):
+    """Classify the error of an API call: 'session' (expired session),
+    'retry' (throttling, transient server faults and network errors) or None
+    (errors that should not be retried)."""
+    import suds.transport
+    if isinstance(error, suds.WebFault):
+        fault = str(getattr(error.fault, 'faultstring', error))
+        if _SESSION_FAULT.search(fault):
+            return 'session'
+        if _THROTTLE_FAULT.search(fault) or _SERVER_FAULT.search(fault):
+            return 'retry'
+        return None
+    if isinstance(error, suds.transport.TransportError):
+        return 'retry' if getattr(error, 'httpcode', 500) >= 500 else None
+    if isinstance(error, (_socket.timeout, _socket.error, IOError)):
+        return 'retry'
+    return None
+
+
+def _wsdl_cache_dir():
+    """Default directory of the parsed WSDLs cache."""
+    cache = (_os.environ.get('XDG_CACHE_HOME') or
+             _os.path.join(_os.path.expanduser('~'), '.cache'))
+    return _os.path.join(cache, 'wos', 'wsdl', 'v%d' % _WSDL_CACHE_VERSION)
+
+
+class _Session(object):
+    """Session (SID) shared by a client and its clones. The lock serializes
+    the authentications, so that an expired session is renewed only once."""
+
+    def __init__(self, SID=None):
+        self.SID = SID
+        self.lock = _threading.RLock()
 
 
 class WosClient():
@@ -22,19 +78,65 @@ class WosClient():
     search_url = base_url + '/esti/wokmws/ws/WokSearch?wsdl'
     searchlite_url = base_url + '/esti/wokmws/ws/WokSearchLite?wsdl'
 
-    def __init__(self, user=None, password=None, SID=None, close_on_exit=True,
-                 lite=False, proxy=None, timeout=600, throttle=(2, 1)):
-        """Create the SOAP clients. user and password for premium access."""
+    auth_ns = 'http://auth.cxf.wokmws.thomsonreuters.com'
+    search_ns = 'http://woksearch.v3.wokmws.thomsonreuters.com'
+    searchlite_ns = 'http://woksearchlite.v3.wokmws.thomsonreuters.com'
 
-        self._SID = SID
+    def __init__(self, user=None, password=None, SID=None, close_on_exit=True,
+                 lite=False, proxy=None, timeout=600, throttle=(2, 1),
+                 cache=None, fast=False, wsdl_cache=None, wsdl_days=7,
+                 wsdl_dir=None, retries=3, backoff=1, observer=None):
+        """Create the SOAP clients. user and password for premium access.
+
+        throttle is the (calls, period) ceiling of an adaptive token bucket
+        (see wos.throttle.AdaptiveThrottle, None to disable it), which slows
+        down on throttling and server faults and on timeouts. These calls are
+        retried up to retries times, waiting an exponential backoff (starting
+        from backoff seconds) with jitter, and an expired session is
+        reconnected (except for the APIs consuming a query ID).
+
+        observer is an optional callable (or list of callables) receiving the
+        wos.metrics.CallStats of every API call not answered by the cache,
+        e.g. a wos.metrics.Collector.
+
+        cache is an optional wos.cache.Cache for the API responses. If fast is
+        True the lean wos.transport.SoapClient is used instead of suds: no WSDL
+        is downloaded and the APIs return the raw XML replies.
+
+        The parsed WSDLs are cached for wsdl_days in the wsdl_cache directory
+        (~/.cache/wos/wsdl by default, False to disable the cache). wsdl_dir is
+        an optional directory with local copies of the WSDLs (named after the
+        services, e.g. WokSearch.wsdl) to avoid downloading them."""
+
+        self._session = _Session(SID)
+        self._cookie = None
+        self._cache = cache
         self._lite = lite
+        self._fast = fast
         self._close_on_exit = close_on_exit
         proxy = {'http': proxy} if proxy else None
         options = {'proxy': proxy, 'timeout': timeout}
+        self._observers = (tuple(observer) if isinstance(observer, list)
+                           else (observer,) if observer else ())
         search_wsdl = self.searchlite_url if lite else self.search_url
-        self._auth = _suds.client.Client(self.auth_url, **options)
-        self._search = _suds.client.Client(search_wsdl, **options)
-        self._throttle_wait = _limit(*throttle)(lambda: True)
+        if fast:
+            from .transport import SoapClient
+            search_ns = self.searchlite_ns if lite else self.search_ns
+            self._auth = SoapClient(self.auth_url, self.auth_ns, **options)
+            self._search = SoapClient(search_wsdl, search_ns, **options)
+        else:
+            import suds.cache
+            if wsdl_cache is not False:
+                options['cache'] = suds.cache.ObjectCache(
+                    wsdl_cache or _wsdl_cache_dir(), days=wsdl_days)
+                options['cachingpolicy'] = 1
+            options['plugins'] = [_metrics._suds_plugin()]
+            self._auth = self._suds_client(self.auth_url, wsdl_dir, options)
+            self._search = self._suds_client(search_wsdl, wsdl_dir, options)
+            self._search.set_options(retxml=lite)
+        self._throttle = _AdaptiveThrottle(*throttle) if throttle else None
+        self._retries = retries
+        self._backoff = backoff
 
         if user and password:
             auth = '%s:%s' % (user, password)
@@ -57,21 +159,145 @@ class WosClient():
         if self._close_on_exit:
             self.close()
 
+    @staticmethod
+    def _suds_client(url, wsdl_dir, options):
+        """Create the suds client of the service, loading the WSDL from
+        wsdl_dir if provided (the endpoint is still the one of the url)."""
+        import suds.client
+        if not wsdl_dir:
+            return suds.client.Client(url, **options)
+        location = url.split('?', 1)[0]
+        wsdl = _os.path.join(_os.path.abspath(wsdl_dir),
+                             location.rsplit('/', 1)[-1] + '.wsdl')
+        return suds.client.Client('file://' + wsdl, location=location,
+                                  **options)
+
+    @staticmethod
+    def _suds_clone(client):
+        """Clone the suds client sharing its service definitions. Unlike
+        suds Client.clone, which deep-copies the linked options and recurses
+        endlessly on recent Python versions, the options are copied one by
+        one on a new transport."""
+        import suds.client
+        import suds.options
+        import suds.properties
+        unskin = suds.properties.Unskin
+        clone = _copy.copy(client)
+        clone.options = suds.options.Options()
+        clone.options.transport = client.options.transport.__class__()
+        options = dict(unskin(client.options).defined)
+        options.pop('transport')
+        options.update(unskin(client.options.transport.options).defined)
+        clone.set_options(**dict((name, _copy.copy(value))
+                                 for name, value in options.items()))
+        clone.service = suds.client.ServiceSelector(clone,
+                                                    client.wsdl.services)
+        clone.messages = dict(tx=None, rx=None)
+        return clone
+
     def is_lite(self):
         """Returns True if the client is for WOS lite"""
         return self._lite
 
+    @property
+    def _SID(self):
+        """Session ID, shared with the clones of this client."""
+        return self._session.SID
+
+    def clone(self, session=True):
+        """Create a client that shares the session (SID), the throttle and the
+        service definitions of this one but has its own SOAP state, so that it
+        can be used concurrently (e.g. from another thread). A session renewed
+        by any of them is used by all the others. With session=False the clone
+        has its own session instead, to be opened with connect(). The clone
+        never closes the session on exit."""
+        clone = _copy.copy(self)
+        clone._close_on_exit = False
+        if not session:
+            clone._session = _Session()
+        clone_soap = (lambda soap: soap.clone()) if self._fast else \
+            self._suds_clone
+        clone._auth = clone_soap(self._auth)
+        clone._search = clone_soap(self._search)
+        return clone
+
     def _api(fn):
-        """API decorator for common tests (sessions open, etc.) and throttle
-        limitation (calls per second)."""
+        """API decorator for common tests (sessions open, etc.), response
+        caching, throttle limitation (calls per second), retries and metrics.
+        The WOS lite APIs return the raw XML reply."""
+        def _attempt(self, stats, args, kwargs):
+            if stats is None:
+                return fn(self, *args, **kwargs)
+            probe = _metrics._start()
+            start = _metrics.clock()
+            try:
+                return fn(self, *args, **kwargs)
+            finally:
+                elapsed = _metrics.clock() - start
+                _metrics._stop()
+                stats.transport += probe.transport
+                stats.parse += elapsed - probe.transport
+                stats.sent += probe.sent
+                stats.received += probe.received
+
+        def _retry(self, stats, args, kwargs):
+            attempt = 0
+            while True:
+                waited = self._throttle.wait() if self._throttle else 0
+                if stats is not None:
+                    stats.throttle += waited
+                SID = self._sync()
+                try:
+                    resp = _attempt(self, stats, args, kwargs)
+                except Exception as error:
+                    kind = _error_kind(error)
+                    bound = fn.__name__ in _SESSION_BOUND
+                    if not kind or attempt >= self._retries or (
+                            kind == 'session' and bound):
+                        raise
+                    attempt += 1
+                    if stats is not None:
+                        stats.retries = attempt
+                    if kind == 'session':
+                        self._reconnect(SID)
+                        continue
+                    if self._throttle:
+                        self._throttle.failure()
+                    delay = (self._backoff * 2 ** (attempt - 1) *
+                             _random.uniform(0.5, 1.5))
+                    if stats is not None:
+                        stats.backoff += delay
+                    _time.sleep(delay)
+                    continue
+                if self._throttle:
+                    self._throttle.success()
+                return resp
+
+        def _call(self, *args, **kwargs):
+            if not self._observers:
+                return _retry(self, None, args, kwargs)
+            stats = _metrics.CallStats(fn.__name__)
+            start = _metrics.clock()
+            try:
+                resp = _retry(self, stats, args, kwargs)
+                stats.records = _metrics.count_records(resp)
+                return resp
+            except Exception as error:
+                stats.error = type(error).__name__
+                raise
+            finally:
+                stats.total = _metrics.clock() - start
+                for observer in self._observers:
+                    observer(stats)
+
         @_functools.wraps(fn)
         def _fn(self, *args, **kwargs):
-            self._throttle_wait()
             if not self._SID:
                 raise RuntimeError('Session closed. Invoke connect() before.')
-            resp = fn(self, *args, **kwargs)
-            return (self._search.last_received().str() if self.is_lite()
-                    else resp)
+            if self._cache is not None:
+                return self._cache.call(self, fn, args, kwargs, lambda:
+                                        _call(self, *args, **kwargs))
+            return _call(self, *args, **kwargs)
         return _fn
 
     def _premium(fn):
@@ -110,22 +336,45 @@ class WosClient():
 
     def connect(self):
         """Authenticate to WOS and set the SID cookie."""
-        if not self._SID:
-            self._SID = self._auth.service.authenticate()
-            print(('Authenticated (SID: %s)' % self._SID).encode('utf-8'))
-
-        self._search.set_options(headers={'Cookie': 'SID="%s"' % self._SID})
-        self._auth.options.headers.update({'Cookie': 'SID="%s"' % self._SID})
-        return self._SID
+        with self._session.lock:
+            if not self._session.SID:
+                SID = self._auth.service.authenticate()
+                if self._fast:
+                    from xml.etree import ElementTree
+                    SID = ElementTree.fromstring(SID).findtext('.//return')
+                self._session.SID = SID
+                print(('Authenticated (SID: %s)' % SID).encode('utf-8'))
+            self._cookie = None
+            return self._sync()
+
+    def _sync(self):
+        """Set the SID cookie if the session was renewed by another client
+        sharing it and return the SID in use."""
+        SID = self._session.SID
+        if SID != self._cookie:
+            self._search.set_options(headers={'Cookie': 'SID="%s"' % SID})
+            self._auth.options.headers.update({'Cookie': 'SID="%s"' % SID})
+            self._cookie = SID
+        return SID
+
+    def _reconnect(self, SID):
+        """Renew the expired session SID, unless another client sharing it
+        has already done it."""
+        with self._session.lock:
+            if self._session.SID == SID:
+                self._session.SID = None
+            self.connect()
 
     def close(self):
         """The close operation loads the session if it is valid and then closes
         it and releases the session seat. All the session data are deleted and
         become invalid after the request is processed. The session ID can no
         longer be used in subsequent requests."""
-        if self._SID:
-            self._auth.service.closeSession()
-            self._SID = None
+        with self._session.lock:
+            if self._session.SID:
+                self._sync()
+                self._auth.service.closeSession()
+                self._session.SID = None
 
     @_api
     def search(self, query, count=5, offset=1, editions=None,
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+
+__all__ = ['COLUMNS', 'FORMATS', 'ColumnarWriter', 'columns', 'write']
+
+from collections import OrderedDict as _OrderedDict
+from sys import version_info as _version_info
+
+# Columns of the columnar exports (the fields of the WosRecords extracted)
+COLUMNS = ('uid', 'year', 'times_cited', 'doi', 'source', 'authors')
+
+# Columnar formats and their file extensions
+FORMATS = _OrderedDict([('parquet', '.parquet'), ('feather', '.feather'),
+                        ('npz', '.npz')])
+
+_STRINGS = ('uid', 'doi', 'source')
+_INTEGERS = ('year', 'times_cited')
+
+
+def columns(records):
+    """Transpose a batch of WosRecords (see wos.records) to a dictionary of
+    columns: lists of values (None if missing) for the scalar columns, and an
+    (offsets, values) pair for the authors, Arrow-style: the authors of the
+    i-th record are values[offsets[i]:offsets[i + 1]]."""
+    batch = _OrderedDict((name, []) for name in COLUMNS[:-1])
+    offsets, values = [0], []
+    for record in records:
+        for name, column in batch.items():
+            column.append(getattr(record, name))
+        values.extend(record.authors or ())
+        offsets.append(len(values))
+    batch['authors'] = (offsets, values)
+    return batch
+
+
+def _import(module, fmt):
+    """Import the module needed by the format, failing with a hint."""
+    try:
+        return __import__(module, fromlist=['_'])
+    except ImportError:
+        raise ImportError('the %s format requires %s (pip install %s)' % (
+            fmt, module, module.split('.')[0]))
+
+
+class _ArrowWriter(object):
+    """Write each batch as an Arrow record batch: a row group of a Parquet
+    file, or a record batch of a Feather (Arrow IPC) file."""
+
+    def __init__(self, path, fmt):
+        pa = self._pa = _import('pyarrow', fmt)
+        self._schema = pa.schema([
+            ('uid', pa.string()), ('year', pa.int32()),
+            ('times_cited', pa.int32()), ('doi', pa.string()),
+            ('source', pa.string()), ('authors', pa.list_(pa.string()))])
+        if fmt == 'parquet':
+            parquet = _import('pyarrow.parquet', fmt)
+            self._writer = parquet.ParquetWriter(path, self._schema)
+            self._write = lambda batch: self._writer.write_table(
+                pa.Table.from_batches([batch]))
+        else:
+            ipc = _import('pyarrow.ipc', fmt)
+            self._writer = ipc.new_file(path, self._schema)
+            self._write = self._writer.write_batch
+
+    def write(self, batch):
+        pa = self._pa
+        offsets, values = batch['authors']
+        arrays = [pa.array(batch[name], type=self._schema.field(name).type)
+                  for name in COLUMNS[:-1]]
+        arrays.append(pa.ListArray.from_arrays(
+            pa.array(offsets, type=pa.int32()),
+            pa.array(values, type=pa.string())))
+        self._write(pa.RecordBatch.from_arrays(arrays, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+class _NpzWriter(object):
+    """Write the batches to a NumPy .npz archive. The arrays are appended to
+    temporary files batch by batch and stored in the archive one at a time
+    when closing. The strings are stored Arrow-style as a uint8 <name>_data
+    array (UTF-8) and an int64 <name>_offsets array, the missing ones empty;
+    the authors of the i-th record are the names authors_offsets[i] to
+    authors_offsets[i + 1] of authors_names_data and authors_names_offsets.
+    """
+
+    def __init__(self, path, fmt):
+        self._np = _import('numpy', fmt)
+        self._path = path
+        self._arrays = _OrderedDict()
+        self._ends = {}
+        for name in _STRINGS + ('authors_names',):
+            self._array(name + '_data', 'uint8')
+            self._array(name + '_offsets', 'int64', [0])
+        for name in _INTEGERS:
+            self._array(name, 'int32')
+        self._array('authors_offsets', 'int64', [0])
+
+    def _array(self, name, dtype, values=()):
+        """Spool an array to a temporary file, starting with the values."""
+        import tempfile
+        self._arrays[name] = (tempfile.TemporaryFile(), dtype)
+        self._ends[name] = 0
+        self._append(name, values)
+
+    def _append(self, name, values):
+        """Append the values to the spooled array."""
+        spool, dtype = self._arrays[name]
+        spool.write(self._np.asarray(values, dtype=dtype).tobytes())
+
+    def _append_offsets(self, name, lengths):
+        """Append the offsets following the lengths to the spooled array."""
+        cumsum = self._np.cumsum(self._np.asarray(lengths, dtype='int64'))
+        self._append(name, cumsum + self._ends[name])
+        if len(cumsum):
+            self._ends[name] += int(cumsum[-1])
+
+    def _append_strings(self, name, strings):
+        """Append the UTF-8 data and offsets of the strings."""
+        encoded = [(s or u'').encode('utf-8') for s in strings]
+        self._append(name + '_data',
+                     self._np.frombuffer(b''.join(encoded), dtype='uint8'))
+        self._append_offsets(name + '_offsets', [len(s) for s in encoded])
+
+    def write(self, batch):
+        for name in _STRINGS:
+            self._append_strings(name, batch[name])
+        for name in _INTEGERS:
+            self._append(name, [-1 if value is None else value
+                                for value in batch[name]])
+        offsets, values = batch['authors']
+        self._append_strings('authors_names', values)
+        self._append_offsets('authors_offsets', self._np.diff(offsets))
+
+    def close(self):
+        import zipfile
+        np = self._np
+        with zipfile.ZipFile(self._path, 'w', allowZip64=True) as archive:
+            for name, (spool, dtype) in self._arrays.items():
+                spool.seek(0)
+                array = np.frombuffer(spool.read(), dtype=dtype)
+                spool.close()
+                if _version_info >= (3, 6):
+                    with archive.open(name + '.npy', 'w',
+                                      force_zip64=True) as member:
+                        np.lib.format.write_array(member, array)
+                else:
+                    self._write_member(archive, name + '.npy', array)
+
+    def _write_member(self, archive, name, array):
+        """Write the array to the archive through a temporary file (python
+        2 cannot write the members of a ZipFile as streams)."""
+        import tempfile
+        import os
+        fd, path = tempfile.mkstemp(suffix='.npy')
+        try:
+            with os.fdopen(fd, 'wb') as member:
+                self._np.lib.format.write_array(member, array)
+            archive.write(path, name)
+        finally:
+            os.remove(path)
+
+
+class ColumnarWriter(object):
+    """Write batches of WosRecords (e.g. the pages of a harvest) to a
+    columnar file, one batch at a time, with the COLUMNS:
+
+    - parquet: one row group per batch (requires pyarrow)
+    - feather: Feather v2 (Arrow IPC) file, one record batch per batch
+      (requires pyarrow)
+    - npz: NumPy archive of flat arrays (requires numpy): the strings are
+      stored as <column>_data (UTF-8 bytes) and <column>_offsets arrays, the
+      authors as authors_offsets into the authors_names_data/_offsets
+      strings, the missing integers as -1
+
+       with ColumnarWriter('records.feather', 'feather') as writer:
+           for year in range(1960, 2020):
+               writer.write(store.find(year=year))
+
+    :path: Path of the file
+    :fmt: Format of the file (see FORMATS)
+    """
+
+    def __init__(self, path, fmt='parquet'):
+        if fmt not in FORMATS:
+            raise ValueError('unknown columnar format: %s' % fmt)
+        self.path = path
+        self.fmt = fmt
+        self.records = 0
+        self._writer = (_NpzWriter if fmt == 'npz' else _ArrowWriter)(
+            path, fmt)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, records):
+        """Write the WosRecords as a batch (nothing if there are none).
+        Return how many were written."""
+        batch = columns(records)
+        count = len(batch['uid'])
+        if count:
+            self._writer.write(batch)
+            self.records += count
+        return count
+
+    def close(self):
+        """Complete and close the file."""
+        self._writer.close()
+
+
+def write(path, records, fmt='parquet', batch=1000):
+    """Write the WosRecords (e.g. of iter_wosrecords, harvest or the records
+    of a RecordStore) to a columnar file in batches of batch records. Return
+    how many were written. Only the COLUMNS are needed:
+
+       write('knuth.npz', iter_wosrecords(client, 'AU=Knuth Donald', 5000,
+                                          fields=COLUMNS), 'npz')"""
+    with ColumnarWriter(path, fmt) as writer:
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= batch:
+                writer.write(chunk)
+                chunk = []
+        writer.write(chunk)
+    return writer.records
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+
+__all__ = ['export', 'read_checkpoint']
+
+from xml.etree import ElementTree as _ET
+from .columnar import COLUMNS as _COLUMNS, FORMATS as _COLUMNAR
+from .columnar import ColumnarWriter as _ColumnarWriter
+from .utils import _get_records, _get_summary, _iter_page, _parse
+from .utils import _iter_page_wosrecords
+import json as _json
+import time as _time
+import sys as _sys
+import os as _os
+import re as _re
+
+_FORMATS = {
+    'jsonl': ('', '', '.jsonl'),
+    'xml': ('<?xml version="1.0" ?>\n<records>\n', '</records>\n', '.xml'),
+}
+
+# Faults of a retrieve whose query ID is no longer known to the service
+_QUERY_FAULT = _re.compile(r'query ?id', _re.I)
+
+
+def read_checkpoint(path):
+    """Read the checkpoint of the export to path, or None if there is none."""
+    try:
+        with open(path + '.checkpoint') as checkpoint:
+            return _json.load(checkpoint)
+    except (IOError, ValueError):
+        return None
+
+
+def _write_checkpoint(path, state):
+    """Atomically write the checkpoint of the export to path."""
+    with open(path + '.checkpoint.tmp', 'w') as checkpoint:
+        _json.dump(state, checkpoint)
+    _os.rename(path + '.checkpoint.tmp', path + '.checkpoint')
+
+
+def _stale_query(error):
+    """Whether the retrieve failed because the query ID died (with the
+    session or on its own), so that the query has to be searched again."""
+    from .client import _error_kind
+    import suds
+    if _error_kind(error) == 'session':
+        return True
+    fault = getattr(getattr(error, 'fault', None), 'faultstring', None)
+    return (isinstance(error, suds.WebFault) and
+            bool(_QUERY_FAULT.search(str(fault or error))))
+
+
+def _last(count, found):
+    """Last record to export (None until the records found are known)."""
+    if found is None or count is None:
+        return found if count is None else count
+    return min(count, found)
+
+
+class _ShardWriter(object):
+    """Write the records to files of shard_size records each, named after
+    path and the shard number. The state (shard, records in the shard and
+    size of the shard file) allows to resume a partially written shard."""
+
+    def __init__(self, path, fmt, shard_size, shard=0, records=0, size=0):
+        self.path = path
+        self.fmt = fmt
+        self.shard_size = shard_size
+        self.shard = shard
+        self.records = records
+        self._file = None
+        self._open(size)
+
+    def _open(self, size=0):
+        """Open the current shard, truncating it to size if resuming."""
+        name = '%s-%05d%s' % (self.path, self.shard, _FORMATS[self.fmt][2])
+        if size:
+            self._file = open(name, 'r+b')
+            self._file.truncate(size)
+            self._file.seek(size)
+        else:
+            self._file = open(name, 'wb')
+            self._file.write(_FORMATS[self.fmt][0].encode('utf-8'))
+
+    def _close(self):
+        """Complete and close the current shard."""
+        self._file.write(_FORMATS[self.fmt][1].encode('utf-8'))
+        self._file.close()
+
+    def write(self, uid, record):
+        """Write the record (XML element) to the current shard."""
+        if self.records >= self.shard_size:
+            self._close()
+            self.shard, self.records = self.shard + 1, 0
+            self._open()
+        record.tail = None
+        xml = _ET.tostring(record, encoding='utf-8').decode('utf-8')
+        if self.fmt == 'jsonl':
+            xml = _json.dumps({'uid': uid, 'xml': xml})
+        self._file.write((xml + '\n').encode('utf-8'))
+        self.records += 1
+
+    def flush(self):
+        """Flush the current shard and return the state of the writer."""
+        self._file.flush()
+        return {'shard': self.shard, 'records': self.records,
+                'size': self._file.tell()}
+
+    def close(self):
+        """Complete and close the last shard."""
+        self._close()
+
+
+class _ColumnarShardWriter(object):
+    """Write the WosRecords to columnar files (see wos.columnar) of
+    shard_size records each, one batch per page. A columnar file cannot be
+    appended to, so a shard is always written from its first record (see
+    export)."""
+
+    def __init__(self, path, fmt, shard_size, shard=0, records=0, size=0):
+        self.path = path
+        self.fmt = fmt
+        self.shard_size = shard_size
+        self.shard = shard
+        self.records = 0
+        self._batch = []
+        self._open()
+
+    def _open(self):
+        """Open the current shard."""
+        self._writer = _ColumnarWriter('%s-%05d%s' % (
+            self.path, self.shard, _COLUMNAR[self.fmt]), self.fmt)
+
+    def write(self, uid, record):
+        """Write the WosRecord to the current shard."""
+        if self.records >= self.shard_size:
+            self.close()
+            self.shard, self.records = self.shard + 1, 0
+            self._open()
+        self._batch.append(record)
+        self.records += 1
+
+    def flush(self):
+        """Write the batch of records and return the state of the writer."""
+        self._writer.write(self._batch)
+        self._batch = []
+        return {'shard': self.shard, 'records': self.records, 'size': 0}
+
+    def close(self):
+        """Complete and close the current shard."""
+        self.flush()
+        self._writer.close()
+
+
+def export(wosclient, wos_query, path, fmt='jsonl', shard_size=10000,
+           count=None, limit=100, log=_sys.stderr):
+    """Export the records found by the query (the first count ones, or all
+    of them if None) to files of shard_size records each, in the JSONL or XML
+    format, or in a columnar format (parquet, feather or npz, see
+    wos.columnar) written page by page from the WosRecords. A checkpoint
+    (query ID, offset and SID) is saved after each page so that an
+    interrupted export resumes where it stopped: if the session changed or
+    the query ID expired, the query is searched again starting from the saved
+    offset (in a new session if the old one expired). The throughput
+    is reported on log. Return the number of exported records."""
+    state = read_checkpoint(path)
+    if not state or state['query'] != wos_query or state['format'] != fmt:
+        state = {'query': wos_query, 'format': fmt, 'SID': None,
+                 'queryId': None, 'found': None, 'offset': 1, 'exported': 0,
+                 'writer': {'shard': 0, 'records': 0, 'size': 0}}
+
+    columnar = fmt in _COLUMNAR
+    if columnar and state['writer']['records']:
+        # the partial shard cannot be appended to: export it again
+        state['offset'] -= state['writer']['records']
+        state['exported'] -= state['writer']['records']
+        state['writer']['records'] = 0
+
+    uid = 'uid' if wosclient.is_lite() else 'UID'
+    writer = (_ColumnarShardWriter if columnar else _ShardWriter)(
+        path, fmt, shard_size, **state['writer'])
+    start, started = _time.time(), state['exported']
+    while True:
+        last = _last(count, state['found'])
+        offset = state['offset']
+        if last is not None and offset > last:
+            break
+        size = min(limit, last - offset + 1) if last is not None else limit
+        result = None
+        if state['queryId'] and state['SID'] == wosclient._SID:
+            try:
+                result = wosclient.retrieve(state['queryId'], size, offset)
+            except Exception as error:
+                if not _stale_query(error):
+                    raise
+                state['queryId'] = None
+        if result is None:
+            result = _parse(wosclient.search(wos_query, size, offset))
+            state['queryId'], state['found'] = _get_summary(wosclient, result)
+            state['SID'] = wosclient._SID
+            if not state['found']:
+                break
+
+        records = _get_records(wosclient, result)
+        if columnar:
+            for record in _iter_page_wosrecords(wosclient, records,
+                                                _COLUMNS):
+                writer.write(record.uid, record)
+                state['exported'] += 1
+        else:
+            for record in _iter_page(wosclient, records):
+                writer.write(record.findtext(uid), record)
+                state['exported'] += 1
+        state['offset'] = offset + size
+        state['writer'] = writer.flush()
+        _write_checkpoint(path, state)
+
+        if log:
+            elapsed = _time.time() - start
+            log.write('exported %d/%d records (%.1f records/s)\n' % (
+                state['exported'], _last(count, state['found']),
+                (state['exported'] - started) / elapsed if elapsed else 0))
+
+    writer.close()
+    if _os.path.exists(path + '.checkpoint'):
+        _os.remove(path + '.checkpoint')
+    return state['exported']
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+__all__ = ['Crawler', 'crawl']
+
+from xml.etree import ElementTree as _ET
+from .records import FIELDS as _FIELDS
+from .utils import _get_records, _get_summary, _iter_page_wosrecords, _parse
+from .utils import retrieve_by_ids as _retrieve_by_ids
+import heapq as _heapq
+import json as _json
+
+_DIRECTIONS = ('citing', 'cited', 'both')
+
+
+def _int(value):
+    """Convert to int, 0 if missing or invalid."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _references(result):
+    """Get the (uid, times cited) of the cited references of a
+    citedReferences or citedReferencesRetrieve result."""
+    if isinstance(result, (bytes, type(u''))):
+        refs = [ref for ret in _ET.fromstring(result).iter('return')
+                for ref in (ret.findall('references') or [ret])]
+        return [(ref.findtext('uid'), _int(ref.findtext('timesCited')))
+                for ref in refs]
+    refs = result if isinstance(result, list) else getattr(
+        result, 'references', None) or []
+    return [(getattr(ref, 'uid', None), _int(getattr(ref, 'timesCited', 0)))
+            for ref in refs]
+
+
+class Crawler(object):
+    """Crawl the citation graph from some seed records up to a given depth,
+    following the citing articles, the cited references or both directions.
+
+    The frontier is a priority queue ordered by depth and then by times cited
+    (most cited first), every record is expanded at most once, each relation
+    is paged with the retrieve operations and the metadata of the cited
+    references are fetched in batches with retrieveById. The edges (citing,
+    cited) are written to the edges file as tab separated lines and the
+    records (see wos.records.WosRecord) to the nodes file as JSON lines, as
+    soon as they are discovered. Requires premium access.
+
+    :wosclient: Connected WosClient
+    :edges: Path of the edges file
+    :nodes: Path of the nodes file (None to skip the metadata)
+    :depth: Maximum distance from the seeds of the expanded records
+    :direction: 'citing', 'cited' or 'both'
+    :limit: Records per request (max 100)
+    :fields: Fields of the records written to the nodes file
+    :max_nodes: Stop after expanding this many records (None for no limit)
+    """
+
+    def __init__(self, wosclient, edges, nodes=None, depth=1,
+                 direction='both', limit=100, fields=_FIELDS, max_nodes=None):
+        if direction not in _DIRECTIONS:
+            raise ValueError('direction must be one of %s' % (_DIRECTIONS,))
+        self.wosclient = wosclient
+        self.depth = depth
+        self.direction = direction
+        self.limit = limit
+        self.fields = fields
+        self.max_nodes = max_nodes
+        self.expanded = set()
+        self.seen = set()
+        self.edges = 0
+        self._frontier = []
+        self._counter = 0
+        self._edges = open(edges, 'w')
+        self._nodes = open(nodes, 'w') if nodes else None
+
+    def close(self):
+        """Close the output files."""
+        self._edges.close()
+        if self._nodes:
+            self._nodes.close()
+
+    def _push(self, uid, depth, times_cited=0):
+        """Add the record to the frontier if it has to be expanded."""
+        if uid and depth < self.depth and uid not in self.expanded:
+            self._counter += 1
+            _heapq.heappush(self._frontier,
+                            (depth, -times_cited, self._counter, uid))
+
+    def _edge(self, citing, cited, other):
+        """Write the edge, unless it was already written expanding other."""
+        if self.direction == 'both' and other in self.expanded:
+            return
+        self._edges.write('%s\t%s\n' % (citing, cited))
+        self.edges += 1
+
+    def _node(self, record):
+        """Write the metadata of a record seen for the first time."""
+        if record.uid in self.seen:
+            return False
+        self.seen.add(record.uid)
+        if self._nodes:
+            self._nodes.write(_json.dumps(record.to_dict()) + '\n')
+        return True
+
+    def _pages(self, first, retrieve, uid):
+        """Yield the pages of a relation of the record."""
+        result = _parse(first(uid, self.limit, 1))
+        query_id, found = _get_summary(self.wosclient, result)
+        if not found:
+            return
+        yield result
+        for x in range(1 + self.limit, found + 1, self.limit):
+            yield retrieve(query_id, min(self.limit, found - x + 1), x)
+
+    def _expand_citing(self, uid, depth):
+        """Follow the articles citing the record."""
+        wc = self.wosclient
+        for result in self._pages(wc.citingArticles, wc.retrieve, uid):
+            records = _get_records(wc, result)
+            if records is None or not len(records):
+                continue
+            for record in _iter_page_wosrecords(wc, records, self.fields):
+                self._node(record)
+                self._edge(record.uid, uid, record.uid)
+                self._push(record.uid, depth + 1, record.times_cited or 0)
+
+    def _expand_cited(self, uid, depth):
+        """Follow the references cited by the record."""
+        wc = self.wosclient
+        for result in self._pages(wc.citedReferences,
+                                  wc.citedReferencesRetrieve, uid):
+            refs = [(ref, tc) for ref, tc in _references(result) if ref]
+            for ref, times_cited in refs:
+                self._edge(uid, ref, ref)
+                self._push(ref, depth + 1, times_cited)
+            self._hydrate([ref for ref, _ in refs if ref not in self.seen])
+
+    def _hydrate(self, uids):
+        """Fetch the metadata of the records in batches with retrieveById."""
+        if not self._nodes:
+            self.seen.update(uids)
+            return
+        for uid, record in _retrieve_by_ids(self.wosclient, set(uids),
+                                            self.limit, self.fields):
+            if record is not None:
+                self._node(record)
+            self.seen.add(uid)
+
+    def crawl(self, seeds):
+        """Crawl the graph from the seed UIDs. Return the number of expanded
+        records, of records seen and of edges written."""
+        self._hydrate([uid for uid in seeds if uid not in self.seen])
+        for uid in seeds:
+            self._push(uid, 0)
+
+        while self._frontier:
+            if self.max_nodes is not None and \
+                    len(self.expanded) >= self.max_nodes:
+                break
+            depth, _, _, uid = _heapq.heappop(self._frontier)
+            if uid in self.expanded:
+                continue
+            if self.direction in ('citing', 'both'):
+                self._expand_citing(uid, depth)
+            if self.direction in ('cited', 'both'):
+                self._expand_cited(uid, depth)
+            self.expanded.add(uid)
+            self._edges.flush()
+            if self._nodes:
+                self._nodes.flush()
+
+        return {'expanded': len(self.expanded), 'seen': len(self.seen),
+                'edges': self.edges}
+
+
+def crawl(wosclient, seeds, edges, nodes=None, depth=1, direction='both',
+          limit=100, fields=_FIELDS, max_nodes=None):
+    """Crawl the citation graph from the seed UIDs (see Crawler) writing the
+    edges and the nodes files. Return the crawl statistics."""
+    crawler = Crawler(wosclient, edges, nodes, depth, direction, limit,
+                      fields, max_nodes)
+    try:
+        return crawler.crawl(seeds)
+    finally:
+        crawler.close()
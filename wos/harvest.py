@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+__all__ = ['harvest', 'plan']
+
+from contextlib import contextmanager as _contextmanager
+from collections import OrderedDict as _OrderedDict
+from datetime import date as _date, timedelta as _timedelta
+from .records import FIELDS as _FIELDS
+from .utils import _get_summary, iter_wosrecords
+import threading as _threading
+
+try:
+    from queue import Queue as _Queue, Empty as _Empty, Full as _Full
+except ImportError:
+    from Queue import Queue as _Queue, Empty as _Empty, Full as _Full
+
+# Maximum number of records that can be retrieved for a query
+MAX_RECORDS = 100000
+
+_DONE = object()
+
+
+def _parse_date(value):
+    """Convert a YYYY-MM-DD string (or a date) to a date."""
+    if isinstance(value, _date):
+        return value
+    year, month, day = (int(part) for part in value.split('-'))
+    return _date(year, month, day)
+
+
+def _time_span(begin, end):
+    """timeSpan search parameter of the dates."""
+    return _OrderedDict([('begin', begin.isoformat()),
+                         ('end', end.isoformat())])
+
+
+def _split(begin, end):
+    """Split the date range in two halves, at the first of January of the
+    middle year if the range spans several years."""
+    if end.year - begin.year >= 1:
+        middle = _date((begin.year + end.year + 1) // 2, 1, 1)
+        return (begin, middle - _timedelta(days=1)), (middle, end)
+    middle = begin + _timedelta(days=(end - begin).days // 2)
+    return (begin, middle), (middle + _timedelta(days=1), end)
+
+
+def plan(wosclient, wos_query, begin='1900-01-01', end=None,
+         max_size=MAX_RECORDS):
+    """Split the query in shards of at most max_size records, bisecting the
+    publication date range recursively and counting the records of each
+    range with a summary search (count=0). Return the list of the shards as
+    (begin, end, found) tuples, with the dates in the YYYY-MM-DD format and
+    without the empty ranges. A single day with more than max_size records
+    becomes an oversized shard."""
+    end = _parse_date(end) if end else _date.today()
+    ranges, shards = [(_parse_date(begin), end)], []
+    while ranges:
+        begin, end = ranges.pop()
+        result = wosclient.search(wos_query, count=0,
+                                  timeSpan=_time_span(begin, end))
+        found = _get_summary(wosclient, result)[1]
+        if found > max_size and begin < end:
+            ranges.extend(reversed(_split(begin, end)))
+        elif found:
+            shards.append((begin.isoformat(), end.isoformat(), found))
+    return shards
+
+
+@_contextmanager
+def _clients(wosclient, workers):
+    """Yield a function checking out a client for a worker thread: from the
+    WosClientPool, or one of the clones of the WosClient (sharing its
+    session and throttle)."""
+    if hasattr(wosclient, 'client'):
+        yield wosclient.client
+        return
+
+    idle = _Queue()
+    for _ in range(workers):
+        idle.put(wosclient.clone())
+
+    @_contextmanager
+    def _checkout():
+        client = idle.get()
+        try:
+            yield client
+        finally:
+            idle.put(client)
+    yield _checkout
+
+
+def harvest(wosclient, wos_query, begin='1900-01-01', end=None,
+            max_size=MAX_RECORDS, workers=4, limit=100, fields=_FIELDS,
+            shards=None):
+    """Harvest a query too big for a single page walk (or for the retrieval
+    cap): plan its shards (see plan), fetch them in parallel and yield the
+    WosRecords (see wos.records) without duplicates as they are fetched. The
+    workers stream the records through a queue of a page per worker, so a
+    slow consumer stops them instead of letting the shards pile up.
+
+    :wosclient: Connected WosClient (whose clones are used by the worker
+                threads) or WosClientPool (whose sessions are used)
+    :workers: Number of shards fetched concurrently (at most the size of the
+              pool, if a WosClientPool is used)
+    :shards: Shards already planned (the query is not planned again)
+    """
+    if hasattr(wosclient, 'client'):
+        workers = min(workers, len(wosclient))
+        if shards is None:
+            with wosclient.client() as client:
+                shards = plan(client, wos_query, begin, end, max_size)
+    elif shards is None:
+        shards = plan(wosclient, wos_query, begin, end, max_size)
+
+    pending = _Queue()
+    for shard in shards:
+        pending.put(shard)
+    queue, stop = _Queue(workers * limit), _threading.Event()
+
+    def _put(item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except _Full:
+                pass
+        return False
+
+    def _work(checkout):
+        try:
+            while not stop.is_set():
+                try:
+                    shard = pending.get_nowait()
+                except _Empty:
+                    break
+                with checkout() as client:
+                    for record in iter_wosrecords(
+                            client, wos_query, shard[2], 1, limit, fields,
+                            timeSpan=_time_span(_parse_date(shard[0]),
+                                                _parse_date(shard[1]))):
+                        if not _put((record, None)):
+                            return
+        except BaseException as error:
+            _put((None, error))
+        else:
+            _put((_DONE, None))
+
+    seen = set()
+    with _clients(wosclient, workers) as checkout:
+        threads = [_threading.Thread(target=_work, args=(checkout,))
+                   for _ in range(workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        running = len(threads)
+        try:
+            while running:
+                record, error = queue.get()
+                if error is not None:
+                    raise error
+                if record is _DONE:
+                    running -= 1
+                elif record.uid not in seen:
+                    seen.add(record.uid)
+                    yield record
+        finally:
+            stop.set()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+
+__all__ = ['CallStats', 'Collector', 'StatsdExporter']
+
+import threading as _threading
+import socket as _socket
+import time as _time
+import sys as _sys
+
+clock = getattr(_time, 'perf_counter', _time.time)
+
+_TIMINGS = ('throttle', 'backoff', 'transport', 'parse', 'total')
+
+# Transport measures of the API call in progress in the current thread
+_local = _threading.local()
+
+# suds plugin class (see _suds_plugin)
+_Plugin = None
+
+
+class CallStats(object):
+    """Measures of a WosClient API call, passed to the observers.
+
+    :api: Name of the API (e.g. 'search')
+    :throttle: Seconds spent waiting for the throttle
+    :backoff: Seconds spent waiting before the retries
+    :transport: Seconds spent sending the request and waiting for the reply
+    :parse: Seconds spent building the request and unmarshalling the reply
+    :total: Seconds spent in the call
+    :sent: Bytes of the requests
+    :received: Bytes of the replies
+    :records: Records (or cited references) returned
+    :retries: Number of retries
+    :error: Name of the exception raised by the call (None if successful)
+    """
+
+    __slots__ = ('api', 'throttle', 'backoff', 'transport', 'parse', 'total',
+                 'sent', 'received', 'records', 'retries', 'error')
+
+    def __init__(self, api):
+        self.api = api
+        self.throttle = self.backoff = self.transport = 0.0
+        self.parse = self.total = 0.0
+        self.sent = self.received = self.records = self.retries = 0
+        self.error = None
+
+    def __repr__(self):
+        return 'CallStats(%s)' % ', '.join(
+            '%s=%r' % (name, getattr(self, name)) for name in self.__slots__)
+
+
+class _Probe(object):
+    """Transport measures of a single request."""
+
+    __slots__ = ('sent', 'received', 'transport', 'start')
+
+    def __init__(self):
+        self.sent = self.received = 0
+        self.transport = 0.0
+        self.start = None
+
+
+def _start():
+    """Start measuring the transport of the requests of the current thread."""
+    probe = _local.probe = _Probe()
+    return probe
+
+
+def _stop():
+    """Stop measuring the transport of the requests of the current thread."""
+    _local.probe = None
+
+
+def _sending(size):
+    """Record that a request of size bytes is being sent."""
+    probe = getattr(_local, 'probe', None)
+    if probe is not None:
+        probe.sent += size
+        probe.start = clock()
+
+
+def _received(size):
+    """Record that a reply of size bytes has been received."""
+    probe = getattr(_local, 'probe', None)
+    if probe is not None and probe.start is not None:
+        probe.received += size
+        probe.transport += clock() - probe.start
+        probe.start = None
+
+
+def _suds_plugin():
+    """Create the suds plugin measuring the size and the transport time of the
+    SOAP messages of the API calls (suds is imported only when needed)."""
+    global _Plugin
+    if _Plugin is None:
+        from suds.plugin import MessagePlugin
+
+        class _Plugin(MessagePlugin):
+            def sending(self, context):
+                _sending(len(context.envelope))
+
+            def received(self, context):
+                _received(len(context.reply))
+    return _Plugin()
+
+
+def count_records(resp):
+    """Count the records (or cited references) of an API response without
+    parsing it."""
+    if isinstance(resp, bytes):
+        return (resp.count(b'&lt;REC ') + resp.count(b'&lt;REC&gt;') or
+                resp.count(b'<records>') or resp.count(b'<references>'))
+    records = getattr(resp, 'records', None)
+    if records is not None:
+        if not isinstance(records, (bytes, type(u''))):
+            return len(records)
+        return records.count('<REC ') + records.count('<REC>')
+    references = getattr(resp, 'references', None)
+    if references is not None:
+        return len(references)
+    return len(resp) if isinstance(resp, list) else 0
+
+
+def _percentile(values, p):
+    """Nearest-rank percentile of the sorted values."""
+    if not values:
+        return 0.0
+    rank = int(round(p * len(values))) - 1
+    return values[min(len(values) - 1, max(0, rank))]
+
+
+class Collector(object):
+    """Observer aggregating the measures of the API calls, thread-safe.
+
+       collector = Collector()
+       with WosClient(observer=collector) as client:
+           ...
+       collector.report()"""
+
+    percentiles = (0.5, 0.9, 0.99)
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = _threading.Lock()
+
+    def __call__(self, stats):
+        with self._lock:
+            self._calls.setdefault(stats.api, []).append(stats)
+
+    def reset(self):
+        """Forget the measures collected so far."""
+        with self._lock:
+            self._calls = {}
+
+    def summary(self):
+        """Return {api: summary} with the number of calls, errors, retries,
+        records and bytes and the percentiles (and the maximum) of the
+        timings (seconds) of every API."""
+        with self._lock:
+            calls = dict((api, list(stats))
+                         for api, stats in self._calls.items())
+        summary = {}
+        for api, stats in calls.items():
+            item = {'calls': len(stats)}
+            for name in ('retries', 'records', 'sent', 'received'):
+                item[name] = sum(getattr(s, name) for s in stats)
+            item['errors'] = sum(1 for s in stats if s.error)
+            for name in _TIMINGS:
+                values = sorted(getattr(s, name) for s in stats)
+                item[name] = dict(('p%g' % (p * 100), _percentile(values, p))
+                                  for p in self.percentiles)
+                item[name]['max'] = values[-1]
+                item[name]['sum'] = sum(values)
+            summary[api] = item
+        return summary
+
+    def report(self, file=_sys.stderr):
+        """Print the summary as a table (timings in milliseconds)."""
+        summary = self.summary()
+        columns = ['p%g' % (p * 100) for p in self.percentiles] + ['max']
+        for api in sorted(summary):
+            item = summary[api]
+            file.write('%s: %d calls, %d errors, %d retries, %d records, '
+                       '%d bytes sent, %d bytes received\n' % (
+                           api, item['calls'], item['errors'],
+                           item['retries'], item['records'], item['sent'],
+                           item['received']))
+            file.write('  %-10s %s %10s\n' % ('ms', ' '.join(
+                '%8s' % column for column in columns), 'total'))
+            for name in _TIMINGS:
+                file.write('  %-10s %s %10.1f\n' % (name, ' '.join(
+                    '%8.1f' % (item[name][column] * 1000)
+                    for column in columns), item[name]['sum'] * 1000))
+        file.flush()
+
+
+class StatsdExporter(object):
+    """Observer sending the measures of the API calls to a StatsD server
+    over UDP (timings in milliseconds, the other measures as counters):
+
+       <prefix>.<api>.<timing>:<ms>|ms
+       <prefix>.<api>.<calls|errors|retries|records|sent|received>:<n>|c
+
+    Network errors are ignored, so that the metrics never break a harvest."""
+
+    def __init__(self, host='localhost', port=8125, prefix='wos'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self._socket = _socket.socket(_socket.AF_INET, _socket.SOCK_DGRAM)
+
+    def __call__(self, stats):
+        name = '%s.%s' % (self.prefix, stats.api)
+        lines = ['%s.%s:%.3f|ms' % (name, timing,
+                                    getattr(stats, timing) * 1000)
+                 for timing in _TIMINGS]
+        lines.append('%s.calls:1|c' % name)
+        for counter in ('retries', 'records', 'sent', 'received'):
+            if getattr(stats, counter):
+                lines.append('%s.%s:%d|c' % (name, counter,
+                                             getattr(stats, counter)))
+        if stats.error:
+            lines.append('%s.errors:1|c' % name)
+        try:
+            self._socket.sendto('\n'.join(lines).encode('ascii'), self.address)
+        except (_socket.error, IOError):
+            pass
+
+    def close(self):
+        """Close the UDP socket."""
+        self._socket.close()
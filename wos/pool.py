@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+__all__ = ['WosClientPool']
+
+from contextlib import contextmanager as _contextmanager
+from .throttle import AdaptiveThrottle as _AdaptiveThrottle
+from .client import WosClient as _WosClient
+
+try:
+    from queue import Queue as _Queue
+except ImportError:
+    from Queue import Queue as _Queue
+
+
+class WosClientPool():
+    """Pool of Web of Science sessions sharing a global throttle, to be used
+    concurrently from several threads.
+    You must provide user and password only to user premium WWS service.
+
+       with WosClientPool(user, password, size=4) as pool:
+           with pool.client() as wos:
+               results = wos.search(...)"""
+
+    def __init__(self, user=None, password=None, size=2, lite=False,
+                 proxy=None, timeout=600, throttle=(2, 1), **kwargs):
+        """Create the SOAP clients (the service definitions are shared). The
+        throttle (calls, period) is enforced across all the sessions."""
+        first = _WosClient(user, password, None, False, lite, proxy, timeout,
+                           throttle=None, **kwargs)
+        first._throttle = _AdaptiveThrottle(*throttle) if throttle else None
+        clones = [first.clone(session=False) for _ in range(size - 1)]
+        self._clients = [first] + clones
+        self._idle = _Queue()
+        for client in self._clients:
+            self._idle.put(client)
+
+    def __enter__(self):
+        """Automatically connect when used with 'with' statements."""
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close all the sessions after closing the 'with' statement."""
+        self.close()
+
+    def __len__(self):
+        """Number of sessions in the pool."""
+        return len(self._clients)
+
+    def connect(self):
+        """Authenticate all the sessions and return their SIDs. If one of them
+        fails the sessions already opened are closed."""
+        try:
+            return [client.connect() for client in self._clients]
+        except Exception as error:
+            try:
+                self.close()
+            except Exception:
+                pass
+            raise error
+
+    def close(self):
+        """Close all the sessions and release their session seats, even if
+        closing some of them fails (the first error is raised at the end)."""
+        error = None
+        for client in self._clients:
+            try:
+                client.close()
+            except Exception as e:
+                if error is None:
+                    error = e
+        if error is not None:
+            raise error
+
+    @_contextmanager
+    def client(self):
+        """Check out an idle client (waiting for one if none is available) and
+        give it back to the pool at the end of the 'with' statement. Expired
+        sessions are re-authenticated by the client itself."""
+        client = self._idle.get()
+        try:
+            yield client
+        finally:
+            self._idle.put(client)
+
+    def map(self, fn, iterable):
+        """Call fn(client, item) for each item in the iterable using all the
+        sessions of the pool concurrently and return the results in order."""
+        # imported here, python 2 needs the futures backport only for map
+        from concurrent.futures import ThreadPoolExecutor
+
+        def _call(item):
+            with self.client() as client:
+                return fn(client, item)
+        with ThreadPoolExecutor(max_workers=len(self)) as executor:
+            return list(executor.map(_call, iterable))
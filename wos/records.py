@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+
+__all__ = ['FIELDS', 'WosRecord', 'from_lite', 'parse_records']
+
+from xml.etree import ElementTree as _ET
+from io import BytesIO as _BytesIO
+
+FIELDS = ('uid', 'title', 'authors', 'source', 'year', 'doi', 'times_cited',
+          'references')
+
+_LISTS = ('authors', 'references')
+
+
+class WosRecord(object):
+    """Compact Web of Science record holding the most used fields. Fields
+    not extracted (see the fields projection of the parsers) are None."""
+
+    __slots__ = FIELDS
+
+    def __init__(self, uid=None, title=None, authors=None, source=None,
+                 year=None, doi=None, times_cited=None, references=None):
+        self.uid = uid
+        self.title = title
+        self.authors = authors
+        self.source = source
+        self.year = year
+        self.doi = doi
+        self.times_cited = times_cited
+        self.references = references
+
+    def __repr__(self):
+        return 'WosRecord(%s)' % ', '.join(
+            '%s=%r' % (field, getattr(self, field)) for field in FIELDS
+            if getattr(self, field) is not None)
+
+    def __eq__(self, other):
+        return (isinstance(other, WosRecord) and
+                all(getattr(self, f) == getattr(other, f) for f in FIELDS))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def to_dict(self):
+        """Return the fields of the record as a dictionary."""
+        return dict((field, getattr(self, field)) for field in FIELDS)
+
+
+def _int(value):
+    """Convert to int, None if missing or invalid."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _set(field, value):
+    """Handler setting the field (only the first value found)."""
+    def _handler(rec, el, parent):
+        if getattr(rec, field) is None:
+            setattr(rec, field, value(el, parent))
+    return _handler
+
+
+def _append(field, value):
+    """Handler appending the value to the list field."""
+    def _handler(rec, el, parent):
+        item = value(el, parent)
+        if item is not None:
+            getattr(rec, field).append(item)
+    return _handler
+
+
+def _when(attr, values, handler):
+    """Run the handler only if the attribute of the element is in values."""
+    def _handler(rec, el, parent):
+        if el.get(attr) in values:
+            handler(rec, el, parent)
+    return _handler
+
+
+def _text(el, parent):
+    return el.text
+
+
+def _author(el, parent):
+    return el.text if parent.get('role') == 'author' else None
+
+
+def _doi(rec, el, parent):
+    """Handler of the DOI identifiers (preferring doi over xref_doi)."""
+    if rec.doi is None or el.get('type') == 'doi':
+        rec.doi = el.get('value')
+
+
+# field: [(event, path relative to REC, handler)]
+_PREMIUM = {
+    'uid': [('end', ('UID',), _set('uid', _text))],
+    'title': [('end', ('static_data', 'summary', 'titles', 'title'),
+               _when('type', ('item',), _set('title', _text)))],
+    'source': [('end', ('static_data', 'summary', 'titles', 'title'),
+                _when('type', ('source',), _set('source', _text)))],
+    'authors': [('end', ('static_data', 'summary', 'names', 'name',
+                         'wos_standard'), _append('authors', _author))],
+    'year': [('start', ('static_data', 'summary', 'pub_info'),
+              _set('year', lambda el, parent: _int(el.get('pubyear'))))],
+    'doi': [('start', ('dynamic_data', 'cluster_related', 'identifiers',
+                       'identifier'),
+             _when('type', ('doi', 'xref_doi'), _doi))],
+    'times_cited': [('start', ('dynamic_data', 'citation_related', 'tc_list',
+                               'silo_tc'),
+                     _when('coll_id', ('WOS',), _set(
+                         'times_cited',
+                         lambda el, parent: _int(el.get('local_count')))))],
+    'references': [('end', ('static_data', 'fullrecord_metadata', 'refs',
+                            'ref', 'uid'), _append('references', _text))],
+}
+
+
+def _compile(fields):
+    """Compile the handlers of the fields into {(event, path): handlers} and
+    the set of the paths leading to them (other subtrees are skipped)."""
+    handlers, prefixes = {}, set()
+    for field in fields:
+        for event, path, handler in _PREMIUM[field]:
+            handlers.setdefault((event, path), []).append(handler)
+            prefixes.update(path[:i] for i in range(1, len(path) + 1))
+    return handlers, prefixes
+
+
+def _new(fields):
+    """Create an empty record for the fields projection."""
+    rec = WosRecord()
+    for field in fields:
+        if field in _LISTS:
+            setattr(rec, field, [])
+    return rec
+
+
+def parse_records(xml, fields=FIELDS):
+    """Parse the premium XML records (bytes) in a single streaming pass and
+    yield a WosRecord for each REC element. Only the given fields are
+    extracted and the subtrees not leading to them are skipped; every element
+    is discarded as soon as it has been processed."""
+    handlers, prefixes = _compile(fields)
+    path, stack, skip, rec = [], [], 0, None
+    for event, el in _ET.iterparse(_BytesIO(xml), events=('start', 'end')):
+        if event == 'start':
+            if skip:
+                skip += 1
+                continue
+            tag = el.tag.rsplit('}', 1)[-1]
+            if rec is not None:
+                path.append(tag)
+                if tuple(path) not in prefixes:
+                    path.pop()
+                    skip = 1
+                    continue
+                for handler in handlers.get(('start', tuple(path)), ()):
+                    handler(rec, el, stack[-1])
+            elif tag == 'REC':
+                rec = _new(fields)
+            stack.append(el)
+            continue
+
+        if skip:
+            el.clear()
+            skip -= 1
+            if not skip:
+                stack[-1].remove(el)
+            continue
+        stack.pop()
+        if rec is not None and path:
+            for handler in handlers.get(('end', tuple(path)), ()):
+                handler(rec, el, stack[-1])
+            path.pop()
+        elif rec is not None:
+            yield rec
+            rec = None
+        el.clear()
+        if stack:
+            stack[-1].remove(el)
+
+
+def _lite_values(record):
+    """Map the labels of the lite record fields to their values."""
+    values = {}
+    for el in record:
+        label = el.findtext('label')
+        if label is not None:
+            values.setdefault(label, []).extend(
+                value.text for value in el.findall('value'))
+    return values
+
+
+def from_lite(record, fields=FIELDS):
+    """Extract a WosRecord from a WOS lite records element (times_cited and
+    references are not available in WOS lite)."""
+    values = _lite_values(record)
+
+    def first(label):
+        return (values.get(label) or [None])[0]
+
+    rec = WosRecord()
+    extract = {
+        'uid': lambda: record.findtext('uid'),
+        'title': lambda: first('Title'),
+        'authors': lambda: values.get('Authors', []),
+        'source': lambda: first('SourceTitle'),
+        'year': lambda: _int(first('Published.BiblioYear')),
+        'doi': lambda: first('Identifier.Doi') or first('Identifier.Xref_Doi'),
+    }
+    for field in fields:
+        if field in extract:
+            setattr(rec, field, extract[field]())
+    return rec
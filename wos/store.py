@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+
+__all__ = ['RecordStore']
+
+from xml.etree import ElementTree as _ET
+from .records import FIELDS as _FIELDS, WosRecord as _WosRecord
+from .records import parse_records as _parse_records
+from .utils import _iter_page_wosrecords, _uid_key, pages, retrieve_by_ids
+import threading as _threading
+import sqlite3 as _sqlite3
+import json as _json
+import time as _time
+import sys as _sys
+
+# symbolicTimeSpan values and the seconds they cover
+_SPANS = (('1week', 7 * 86400), ('2week', 14 * 86400), ('4week', 28 * 86400))
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS records (
+    uid TEXT PRIMARY KEY, title TEXT, source TEXT, year INTEGER, doi TEXT,
+    times_cited INTEGER, refs TEXT, updated REAL);
+CREATE TABLE IF NOT EXISTS authors (
+    uid TEXT, position INTEGER, name TEXT, PRIMARY KEY (uid, position));
+CREATE TABLE IF NOT EXISTS harvests (
+    query TEXT PRIMARY KEY, harvested REAL, records INTEGER);
+CREATE INDEX IF NOT EXISTS records_doi ON records (doi);
+CREATE INDEX IF NOT EXISTS records_year ON records (year);
+CREATE INDEX IF NOT EXISTS records_source ON records (source);
+CREATE INDEX IF NOT EXISTS authors_name ON authors (name);
+'''
+
+# (column, field) of the records table
+_COLUMNS = (('title', 'title'), ('source', 'source'), ('year', 'year'),
+            ('doi', 'doi'), ('times_cited', 'times_cited'),
+            ('refs', 'references'))
+
+
+class RecordStore(object):
+    """Local store of the harvested records (see wos.records.WosRecord)
+    backed by an SQLite database, keyed by UID and indexed by DOI, year,
+    source and author, to avoid downloading the same records again.
+
+    Records harvested with a fields projection only update the extracted
+    fields of the stored records. The DOIs are stored lowercase.
+
+       store = RecordStore('records.db')
+       store.harvest(client, 'AU=Knuth Donald')
+       store.refresh(client, 'AU=Knuth Donald')  # only the new records
+       doi_to_wos(client, doi, store=store)       # answered locally
+
+    :path: Path of the SQLite database file
+    """
+
+    def __init__(self, path):
+        self._db = _sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+        self._lock = _threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM records'
+                                    ).fetchone()[0]
+
+    def __contains__(self, uid):
+        with self._lock:
+            return self._db.execute('SELECT 1 FROM records WHERE uid=?',
+                                    (uid,)).fetchone() is not None
+
+    def close(self):
+        """Close the SQLite database."""
+        with self._lock:
+            self._db.close()
+
+    def _upsert(self, record, now):
+        """Insert or update the record (without committing)."""
+        values = [getattr(record, field) for _, field in _COLUMNS]
+        if values[3] is not None:
+            values[3] = values[3].lower()
+        if values[5] is not None:
+            values[5] = _json.dumps(values[5])
+        self._db.execute('INSERT OR IGNORE INTO records (uid) VALUES (?)',
+                         (record.uid,))
+        self._db.execute(
+            'UPDATE records SET %s, updated=? WHERE uid=?' % ', '.join(
+                '%s=COALESCE(?, %s)' % (column, column)
+                for column, _ in _COLUMNS),
+            values + [now, record.uid])
+        if record.authors is not None:
+            self._db.execute('DELETE FROM authors WHERE uid=?', (record.uid,))
+            self._db.executemany('INSERT INTO authors VALUES (?, ?, ?)', [
+                (record.uid, i, name)
+                for i, name in enumerate(record.authors)])
+
+    def add(self, records):
+        """Insert or update the records. Return how many were stored."""
+        count, now = 0, _time.time()
+        with self._lock:
+            try:
+                for record in records:
+                    if record.uid:
+                        self._upsert(record, now)
+                        count += 1
+            finally:
+                self._db.commit()
+        return count
+
+    def _records(self, where, params):
+        """Build the WosRecords of the rows matching the WHERE clause."""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT uid, %s FROM records WHERE %s ORDER BY uid' % (
+                    ', '.join(column for column, _ in _COLUMNS), where),
+                params).fetchall()
+            authors = {}
+            for uid, name in self._db.execute(
+                    'SELECT uid, name FROM authors WHERE uid IN (SELECT uid '
+                    'FROM records WHERE %s) ORDER BY uid, position' % where,
+                    params):
+                authors.setdefault(uid, []).append(name)
+        for row in rows:
+            record = _WosRecord(row[0], authors=authors.get(row[0], []))
+            for (column, field), value in zip(_COLUMNS, row[1:]):
+                if column == 'refs' and value is not None:
+                    value = _json.loads(value)
+                setattr(record, field, value)
+            yield record
+
+    def get(self, uid):
+        """Get the stored record, None if missing."""
+        return next(self._records('uid=?', (uid,)), None)
+
+    def find(self, doi=None, year=None, source=None, author=None):
+        """Get the stored records matching all the given criteria (the author
+        in the wos_standard form, e.g. 'Knuth, DE')."""
+        where, params = [], []
+        for column, value in (('doi', doi and doi.lower()), ('year', year),
+                              ('source', source)):
+            if value is not None:
+                where.append('%s=?' % column)
+                params.append(value)
+        if author is not None:
+            where.append('uid IN (SELECT uid FROM authors WHERE name=?)')
+            params.append(author)
+        return list(self._records(' AND '.join(where) or '1', params))
+
+    def doi_to_wos(self, doi):
+        """Get the UIDs of the stored records with the DOI."""
+        with self._lock:
+            return [row[0] for row in self._db.execute(
+                'SELECT uid FROM records WHERE doi=? ORDER BY uid',
+                (doi.strip().lower(),))]
+
+    def harvest(self, wosclient, wos_query, count=_sys.maxsize, limit=100,
+                span=None, fields=_FIELDS):
+        """Query Web of Science and store the records. With span ('1week',
+        '2week' or '4week') only the records loaded in the database in that
+        time span are fetched (symbolicTimeSpan). Return how many records
+        were stored."""
+        started, stored = _time.time(), 0
+        kwargs = {'symbolicTimeSpan': span} if span else {}
+        for records in pages(wosclient, wos_query, count, 1, limit, **kwargs):
+            stored += self.add(_iter_page_wosrecords(wosclient, records,
+                                                     fields))
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO harvests VALUES (?, ?, COALESCE(('
+                'SELECT records FROM harvests WHERE query=?), 0) + ?)',
+                (wos_query, started, wos_query, stored))
+            self._db.commit()
+        return stored
+
+    def harvested(self, wos_query):
+        """Timestamp of the last harvest of the query, None if never."""
+        with self._lock:
+            row = self._db.execute('SELECT harvested FROM harvests WHERE '
+                                   'query=?', (wos_query,)).fetchone()
+        return row and row[0]
+
+    def refresh(self, wosclient, wos_query, limit=100, fields=_FIELDS):
+        """Fetch only the records loaded since the last harvest of the query,
+        using the shortest symbolicTimeSpan covering it (the query is harvested
+        in full if never harvested or harvested more than 4 weeks ago).
+        Return how many records were stored."""
+        last = self.harvested(wos_query)
+        elapsed = _time.time() - last if last is not None else None
+        span = next((name for name, seconds in _SPANS
+                     if elapsed is not None and elapsed <= seconds), None)
+        return self.harvest(wosclient, wos_query, limit=limit, span=span,
+                            fields=fields)
+
+    def retrieve_by_id(self, wosclient, uids, fields=_FIELDS, batch=100):
+        """Get the records with the UIDs (in order, None for the records not
+        found), answering from the store and fetching only the missing ones
+        (see wos.utils.retrieve_by_ids), which are then stored. The UIDs
+        match with or without the WOS: prefix."""
+        uids = list(uids)
+        names = _unique(name for uid in uids if uid for name in
+                        (uid.strip(), 'WOS:' + _uid_key(uid)))
+        found = {}
+        for x in range(0, len(names), 500):
+            chunk = names[x:x + 500]
+            found.update((_uid_key(record.uid), record) for record in
+                         self._records('uid IN (%s)' % ', '.join(
+                             '?' * len(chunk)), chunk))
+        missing = [uid for uid in _unique(uids)
+                   if uid and _uid_key(uid) not in found]
+        records = []
+        for uid, record in retrieve_by_ids(wosclient, missing, batch, fields):
+            if record is not None:
+                found[_uid_key(uid)] = record
+                records.append(record)
+            if len(records) >= batch:
+                self.add(records)
+                records = []
+        self.add(records)
+        return [found.get(_uid_key(uid)) if uid else None for uid in uids]
+
+    def tee(self, elements, fields=_FIELDS):
+        """Yield the premium REC elements (e.g. of iter_records) storing
+        their records once the iteration is over."""
+        records = []
+        try:
+            for el in elements:
+                records.extend(_parse_records(_ET.tostring(el), fields))
+                yield el
+        finally:
+            self.add(records)
+
+
+def _unique(items):
+    """The items without duplicates, in order."""
+    seen = set()
+    return [item for item in items if not (item in seen or seen.add(item))]
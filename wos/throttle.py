@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+__all__ = ['AdaptiveThrottle']
+
+import threading as _threading
+import time as _time
+
+_clock = getattr(_time, 'monotonic', _time.time)
+
+
+class AdaptiveThrottle(object):
+    """Thread-safe token bucket allowing `calls` requests every `period`
+    seconds, with bursts of up to `burst` requests (default: calls).
+
+    The rate adapts to the health of the server: every failure (throttling,
+    server faults, timeouts) multiplies it by `decrease` (down to `floor`
+    requests per second) and every success increases it by `increase` times
+    the ceiling, up to the configured calls/period ceiling."""
+
+    def __init__(self, calls=2, period=1, burst=None, decrease=0.5,
+                 increase=0.1, floor=0.05):
+        self.ceiling = float(calls) / period
+        self.rate = self.ceiling
+        self.burst = burst or calls
+        self.decrease = decrease
+        self.increase = increase
+        self.floor = floor
+        self._tokens = float(self.burst)
+        self._last = _clock()
+        self._lock = _threading.Lock()
+
+    def wait(self):
+        """Take a token, sleeping until one is available. Return the number
+        of seconds spent waiting."""
+        with self._lock:
+            now = _clock()
+            self._tokens = min(self.burst,
+                               self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0
+        if delay:
+            _time.sleep(delay)
+        return delay
+
+    __call__ = wait
+
+    def failure(self):
+        """Slow down after a failed request."""
+        with self._lock:
+            self.rate = max(self.floor, self.rate * self.decrease)
+
+    def success(self):
+        """Speed back up (to the ceiling) after a successful request."""
+        with self._lock:
+            self.rate = min(self.ceiling,
+                            self.rate + self.increase * self.ceiling)
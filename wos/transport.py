@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+
+__all__ = ['SoapClient']
+
+from xml.etree import ElementTree as _ET
+from . import metrics as _metrics
+import errno as _errno
+import copy as _copy
+
+try:
+    from http.client import HTTPConnection as _HTTPConnection
+    from http.client import HTTPSConnection as _HTTPSConnection
+    from http.client import BadStatusLine as _BadStatusLine
+    from urllib.parse import urlsplit as _urlsplit
+except ImportError:
+    from httplib import HTTPConnection as _HTTPConnection
+    from httplib import HTTPSConnection as _HTTPSConnection
+    from httplib import BadStatusLine as _BadStatusLine
+    from urlparse import urlsplit as _urlsplit
+
+_SOAPENV = 'http://schemas.xmlsoap.org/soap/envelope/'
+
+_ENVELOPE = ('<soapenv:Envelope xmlns:soapenv="%s" xmlns:ns="{0}">'
+             '<soapenv:Header/><soapenv:Body><ns:{1}>{{0}}</ns:{1}>'
+             '</soapenv:Body></soapenv:Envelope>' % _SOAPENV)
+
+
+try:
+    _STALE = (_BadStatusLine, BrokenPipeError, ConnectionResetError)
+except NameError:
+    _STALE = (_BadStatusLine,)
+
+
+def _stale(error):
+    """Whether the error means that the server closed the kept-alive
+    connection before the request (no reply, broken pipe or reset). Also
+    RemoteDisconnected on python 3, a subclass of BadStatusLine."""
+    return (isinstance(error, _STALE) or
+            getattr(error, 'errno', None) in (_errno.EPIPE, _errno.ECONNRESET))
+
+
+def _escape(text):
+    """Escape &, < and > in the text, like xml.sax.saxutils.escape (whose
+    import loads urllib.request)."""
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+class _Fault(object):
+    """SOAP fault details, as exposed by suds.WebFault.fault."""
+
+    def __init__(self, faultcode, faultstring):
+        self.faultcode = faultcode
+        self.faultstring = faultstring
+
+
+class _Options(object):
+    """Options of the SoapClient (the subset of the suds ones in use)."""
+
+    def __init__(self, proxy=None, timeout=600, headers=None):
+        self.proxy = proxy
+        self.timeout = timeout
+        self.headers = headers or {}
+
+
+def _serialize(name, value):
+    """Serialize a (nested) dictionary argument to XML. Lists become repeated
+    elements and None values are omitted."""
+    if value is None:
+        return ''
+    if isinstance(value, (list, tuple)):
+        return ''.join(_serialize(name, item) for item in value)
+    if isinstance(value, dict):
+        value = ''.join(_serialize(k, v) for k, v in value.items())
+    elif isinstance(value, bool):
+        value = 'true' if value else 'false'
+    else:
+        value = _escape(value if isinstance(value, type(u'')) else
+                        str(value))
+    return '<{0}>{1}</{0}>'.format(name, value)
+
+
+class _Service(object):
+    """Dispatch the operations of a SoapClient (client.service.operation)."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, operation):
+        return lambda **kwargs: self._client.invoke(operation, **kwargs)
+
+
+class SoapClient(object):
+    """Lean SOAP client for the Web of Science web services. The request
+    envelopes are built from templates, sent over a persistent keep-alive
+    HTTP connection, and the raw XML reply is returned as bytes without
+    building any object. The interface mimics the subset of the suds client
+    used by WosClient.
+
+    :url: Service endpoint (an eventual ?wsdl suffix is ignored)
+    :namespace: Target namespace of the service operations
+    :proxy: Dictionary {'http': 'host:port'} of the HTTP proxy
+    :timeout: Socket timeout in seconds
+    """
+
+    def __init__(self, url, namespace, proxy=None, timeout=600):
+        self.url = url.split('?', 1)[0]
+        self.namespace = namespace
+        self.options = _Options(proxy, timeout)
+        self.service = _Service(self)
+        self._envelopes = {}
+        self._connection = None
+
+    def clone(self):
+        """Get a copy of this client with its own options and connection."""
+        clone = _copy.copy(self)
+        clone.options = _copy.deepcopy(self.options)
+        clone.service = _Service(clone)
+        clone._connection = None
+        return clone
+
+    def set_options(self, **kwargs):
+        """Set the options of the client (headers, proxy, timeout)."""
+        for name, value in kwargs.items():
+            setattr(self.options, name, value)
+
+    def _envelope(self, operation):
+        """Get the prebuilt envelope template for the operation."""
+        if operation not in self._envelopes:
+            self._envelopes[operation] = _ENVELOPE.format(self.namespace,
+                                                          operation)
+        return self._envelopes[operation]
+
+    def _connect(self):
+        """Open the persistent connection to the service (or proxy)."""
+        url = _urlsplit(self.url)
+        proxy = (self.options.proxy or {}).get(url.scheme)
+        if proxy:
+            return _HTTPConnection(proxy, timeout=self.options.timeout)
+        connection = (_HTTPSConnection if url.scheme == 'https' else
+                      _HTTPConnection)
+        return connection(url.netloc, timeout=self.options.timeout)
+
+    def _post(self, body, headers):
+        """POST the body reusing the connection, reconnecting once if the
+        server closed it in the meantime. Any other error (e.g. a timeout,
+        after which the request may have been processed) is raised to the
+        retries of the client."""
+        path = (self.url if (self.options.proxy or {}).get('http') else
+                _urlsplit(self.url).path)
+        while True:
+            fresh = self._connection is None
+            if fresh:
+                self._connection = self._connect()
+            try:
+                self._connection.request('POST', path, body, headers)
+                response = self._connection.getresponse()
+                return response.status, response.read()
+            except Exception as error:
+                self._connection.close()
+                self._connection = None
+                if fresh or not _stale(error):
+                    raise
+
+    def invoke(self, operation, **kwargs):
+        """Invoke the operation and return the raw XML reply. Raise a
+        suds.WebFault if the service replies with a SOAP fault."""
+        body = ''.join(_serialize(k, v) for k, v in kwargs.items())
+        body = self._envelope(operation).format(body).encode('utf-8')
+        headers = {'Content-Type': 'text/xml; charset=utf-8',
+                   'SOAPAction': '""'}
+        headers.update(self.options.headers)
+        _metrics._sending(len(body))
+        status, reply = self._post(body, headers)
+        _metrics._received(len(reply))
+        if status < 400:
+            return reply
+        import suds.transport
+        if status == 500 and reply:
+            fault = _ET.fromstring(reply).find('.//{%s}Fault' % _SOAPENV)
+            if fault is not None:
+                raise suds.WebFault(_Fault(fault.findtext('faultcode'),
+                                           fault.findtext('faultstring')),
+                                    reply)
+        raise suds.transport.TransportError(reply, status)
@@ -1,57 +1,453 @@
 #!/usr/bin/env python
 
-__all__ = ['doi_to_wos', 'query', 'single']
+__all__ = ['doi_to_wos', 'doi_to_wos_many', 'extract', 'iter_records',
+           'iter_wosrecords', 'pages', 'query', 'retrieve_by_ids', 'single']
 
 from xml.etree import ElementTree as _ET
-from xml.dom import minidom as _minidom
+from collections import OrderedDict as _OrderedDict
+from io import BytesIO as _BytesIO
+from itertools import chain as _chain
+from .records import FIELDS as _FIELDS, from_lite as _from_lite
+from .records import parse_records as _parse_records
+import threading as _threading
 import re as _re
+import sys as _sys
 
+try:
+    from queue import Queue as _Queue, Full as _Full
+except ImportError:
+    from Queue import Queue as _Queue, Full as _Full
 
-def _get_records(wosclient, wos_query, count=5, offset=1):
-    """Get the XML records for both WOS lite and premium."""
+_DONE = object()
+
+
+def _parse(result):
+    """Parse the raw SOAP replies (returned for WOS lite and by the fast
+    transport) to their return element. Other results are left untouched."""
+    if isinstance(result, (bytes, type(u''))):
+        return _ET.fromstring(result).find('.//return')
+    return result
+
+
+def _get_records(wosclient, result):
+    """Get the records from a result: the return element for WOS lite and the
+    XML string of the records for premium (None if there are none)."""
+    result = _parse(result)
     if wosclient.is_lite():
-        result = wosclient.search(wos_query, count, offset)
-        pattern = r'<{0}>.*?</{0}>'.format('return')
-        return _re.search(pattern, result, _re.S).group(0)
+        return result
+    elif _ET.iselement(result):
+        return result.findtext('records')
     else:
-        return wosclient.search(wos_query, count, offset).records
+        return getattr(result, 'records', None)
+
+
+def _get_summary(wosclient, result):
+    """Get the query ID and the number of records found from a result."""
+    result = _parse(result)
+    if _ET.iselement(result):
+        return result.findtext('queryId'), int(result.findtext('recordsFound'))
+    else:
+        return result.queryId, int(result.recordsFound)
+
+
+def _iter_page(wosclient, records):
+    """Iterate over the record elements of a page of records."""
+    if wosclient.is_lite():
+        return iter(records.findall('records'))
+    return _iterparse(records.encode('utf-8'), 'REC')
 
 
 def prettify(xml):
-    xml = _minidom.parseString(xml).toprettyxml(indent=' '*4)
+    from xml.dom import minidom
+    xml = minidom.parseString(xml).toprettyxml(indent=' '*4)
     return '\n'.join([line for line in xml.split('\n') if line.strip()])
 
 
-def single(wosclient, wos_query, xml_query=None, count=5, offset=1):
-    """Perform a single Web of Science query and then XML query the results."""
-    records = _get_records(wosclient, wos_query, count, offset)
+def _compile_path(path):
+    """Compile a path relative to the record into a function returning the
+    text of the first matching element (or the attribute, if the path ends
+    with @attribute). If the path is wrapped in a list the function returns
+    the values of all the matching elements."""
+    many = isinstance(path, (list, tuple))
+    path = path[0] if many else path
+    head, sep, attr = path.rpartition('@')
+    if sep and not (set(attr) & set('[]/=')):
+        path = head.rstrip('/') or '.'
+    else:
+        attr = None
+
+    def value(el):
+        return el.get(attr) if attr else el.text
+
+    if many:
+        return lambda record: [value(el) for el in record.iterfind(path)]
+
+    def first(record):
+        el = record.find(path)
+        return None if el is None else value(el)
+    return first
+
+
+def _compile_paths(paths):
+    """Compile the dictionary of named paths (see extract)."""
+    return [(name, _compile_path(path)) for name, path in paths.items()]
+
+
+def _extract_page(wosclient, records, compiled):
+    """Extract the compiled paths from each record of a page, as rows."""
+    return [_OrderedDict((name, get(record)) for name, get in compiled)
+            for record in _iter_page(wosclient, records)]
+
+
+def _xml_query(wosclient, records, xml_query=None, pretty=True):
+    """XML query the records of a page: a path returns the texts of the
+    matching elements, a dictionary of named paths the extracted rows (see
+    extract) and no query the XML of the records (prettified if pretty)."""
+    if isinstance(xml_query, dict):
+        return _extract_page(wosclient, records, _compile_paths(xml_query))
+    if _ET.iselement(records):
+        xml = _ET.tostring(records)
+        if not xml_query:
+            return prettify(xml) if pretty else xml.decode('utf-8')
+        return [el.text for el in records.findall(xml_query)]
     xml = _re.sub(' xmlns="[^"]+"', '', records, count=1).encode('utf-8')
     if not xml_query:
-        return prettify(xml)
+        return prettify(xml) if pretty else xml.decode('utf-8')
     xml = _ET.fromstring(xml)
     return [el.text for el in xml.findall(xml_query)]
 
 
-def query(wosclient, wos_query, xml_query=None, count=5, offset=1, limit=100):
-    """Query Web of Science and XML query results with multiple requests."""
-    results = [single(wosclient, wos_query, xml_query, min(limit, count-x+1), x)
-               for x in range(offset, count+1, limit)]
+def single(wosclient, wos_query, xml_query=None, count=5, offset=1,
+           pretty=True):
+    """Perform a single Web of Science query and then XML query the results
+    (xml_query can also be a dictionary of named paths, see extract)."""
+    result = wosclient.search(wos_query, count, offset)
+    return _xml_query(wosclient, _get_records(wosclient, result), xml_query,
+                      pretty)
+
+
+def pages(wosclient, wos_query, count=5, offset=1, limit=100, prefetch=0,
+          **kwargs):
+    """Search Web of Science once and yield the XML records of each page
+    (from offset to count), retrieving the following pages by query ID. The
+    other keyword arguments (e.g. symbolicTimeSpan) are passed to search.
+
+    If prefetch is positive the pages are fetched by a background thread (with
+    a clone of the client, within its throttle) while the current page is
+    being consumed, keeping at most prefetch pages ready: a slow consumer
+    stops the fetcher instead of letting the pages pile up in memory. The
+    errors of the fetcher are raised by the consumer. A single page is never
+    prefetched."""
+    if prefetch > 0 and count - offset + 1 > limit:
+        return _prefetch(wosclient, prefetch, _pages, wosclient, wos_query,
+                         count, offset, limit, **kwargs)
+    return _pages(wosclient, wos_query, count, offset, limit, **kwargs)
+
+
+def _pages(wosclient, wos_query, count, offset, limit, **kwargs):
+    """Yield the XML records of each page of the query (see pages)."""
+    if count < offset:
+        return
+    result = _parse(wosclient.search(wos_query, min(limit, count-offset+1),
+                                     offset, **kwargs))
+    query_id, found = _get_summary(wosclient, result)
+    count = min(count, found)
+    if count >= offset:
+        yield _get_records(wosclient, result)
+    for x in range(offset+limit, count+1, limit):
+        result = wosclient.retrieve(query_id, min(limit, count-x+1), x)
+        yield _get_records(wosclient, result)
+
+
+def _prefetch(wosclient, size, fn, *args, **kwargs):
+    """Run the generator fn(*args, **kwargs) in a background thread, with a
+    clone of the client in place of the wosclient argument, and yield its
+    items through a queue of at most size items."""
+    if hasattr(wosclient, 'clone'):
+        clone = wosclient.clone()
+        args = tuple(clone if arg is wosclient else arg for arg in args)
+    queue, stop = _Queue(size), _threading.Event()
+
+    def _put(item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except _Full:
+                pass
+        return False
+
+    def _fetch():
+        try:
+            for item in fn(*args, **kwargs):
+                if not _put((item, None)):
+                    return
+        except BaseException as error:
+            _put((None, error))
+        else:
+            _put((_DONE, None))
+
+    thread = _threading.Thread(target=_fetch)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            item, error = queue.get()
+            if error is not None:
+                raise error
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def _iterparse(xml, tag):
+    """Incrementally parse the XML and yield the elements with the given tag
+    (namespaces are stripped), dropping each of them once consumed."""
+    parents = []
+    for event, el in _ET.iterparse(_BytesIO(xml), events=('start', 'end')):
+        if event == 'start':
+            el.tag = el.tag.rsplit('}', 1)[-1]
+            parents.append(el)
+            continue
+        parents.pop()
+        if el.tag == tag:
+            yield el
+            el.clear()
+            if parents:
+                parents[-1].remove(el)
+
+
+def iter_records(wosclient, wos_query, count=5, offset=1, limit=100,
+                 prefetch=0, **kwargs):
+    """Query Web of Science and yield the parsed records one at a time (REC
+    elements for premium, records elements for lite), keeping in memory at
+    most one page of results (plus the prefetched ones, see pages)."""
+    for records in pages(wosclient, wos_query, count, offset, limit,
+                         prefetch, **kwargs):
+        for record in _iter_page(wosclient, records):
+            yield record
+
+
+def _iter_page_wosrecords(wosclient, records, fields=_FIELDS):
+    """Iterate over the WosRecord of a page of records."""
+    if wosclient.is_lite():
+        return (_from_lite(record, fields)
+                for record in records.findall('records'))
+    return _parse_records(records.encode('utf-8'), fields)
+
+
+def iter_wosrecords(wosclient, wos_query, count=5, offset=1, limit=100,
+                    fields=_FIELDS, prefetch=0, **kwargs):
+    """Query Web of Science and yield a compact WosRecord for each record,
+    extracting only the given fields (see wos.records.FIELDS). The pages can
+    be prefetched (see pages)."""
+    for records in pages(wosclient, wos_query, count, offset, limit,
+                         prefetch, **kwargs):
+        for record in _iter_page_wosrecords(wosclient, records, fields):
+            yield record
+
+
+def query(wosclient, wos_query, xml_query=None, count=5, offset=1, limit=100,
+          pretty=True, prefetch=0):
+    """Query Web of Science and XML query results with multiple requests
+    (xml_query can also be a dictionary of named paths, see extract). Without
+    xml_query the XML of the records is returned, prettified if pretty. With
+    prefetch the next pages are fetched while the current one is processed
+    (see pages)."""
+    if wosclient.is_lite() and not xml_query:
+        result = _ET.Element('return')
+        for records in pages(wosclient, wos_query, count, offset, limit,
+                             prefetch):
+            result.extend(records)
+        xml = _ET.tostring(result)
+        return (prettify(xml) if pretty else
+                '<?xml version="1.0" ?>\n%s' % xml.decode('utf-8'))
+
+    results = [_xml_query(wosclient, records, xml_query, pretty)
+               for records in pages(wosclient, wos_query, count, offset, limit,
+                                    prefetch)]
     if xml_query:
         return [el for res in results for el in res]
 
-    if wosclient.is_lite():
-        pattern = _re.compile(r'.*?<return>|</return>.*', _re.DOTALL)
-        res_string = '<?xml version="1.0" ?>\n<return>%s</return>'
-    else:
+    if pretty:
         pattern = _re.compile(r'^<\?xml.*?\n<records>\n|\n</records>$.*')
-        res_string = '<?xml version="1.0" ?>\n<records>%s</records>'
+    else:
+        pattern = _re.compile(r'^\s*(<\?xml[^>]*>)?\s*<records>'
+                              r'|</records>\s*$')
+    res_string = '<?xml version="1.0" ?>\n<records>%s</records>'
     return res_string % '\n'.join(pattern.sub('', res) for res in results)
 
 
-def doi_to_wos(wosclient, doi):
-    """Convert DOI to WOS identifier."""
+def extract(wosclient, wos_query, paths, count=5, offset=1, limit=100,
+            columns=False, prefetch=0):
+    """Query Web of Science and extract from each record all the named paths
+    of the dictionary in a single streaming pass per page. The paths are
+    relative to the record and compiled once: a path returns the text of the
+    first matching element, path@attribute its attribute, and a path wrapped
+    in a list the values of all the matches, e.g.
+
+        {'uid': 'UID',
+         'year': 'static_data/summary/pub_info@pubyear',
+         'authors': ['static_data/summary/names/name/wos_standard']}
+
+    Return the list of rows (dictionaries), or the dictionary of the columns
+    (lists) if columns is True. With prefetch the next pages are fetched while
+    the current one is processed (see pages)."""
+    compiled = _compile_paths(paths)
+    if not columns:
+        return [row for records in pages(wosclient, wos_query, count, offset,
+                                         limit, prefetch)
+                for row in _extract_page(wosclient, records, compiled)]
+
+    result = _OrderedDict((name, []) for name, _ in compiled)
+    for records in pages(wosclient, wos_query, count, offset, limit,
+                         prefetch):
+        for record in _iter_page(wosclient, records):
+            for name, get in compiled:
+                result[name].append(get(record))
+    return result
+
+
+def doi_to_wos(wosclient, doi, store=None):
+    """Convert DOI to WOS identifier. If a wos.store.RecordStore is given the
+    DOI is looked up there first, and the record found is stored."""
     if wosclient.is_lite():
         raise NotImplementedError('Not implemented for WOS Lite')
 
+    if store is not None:
+        uids = store.doi_to_wos(doi)
+        if len(uids) == 1:
+            return uids[0].lstrip('WOS:')
+        records = list(iter_wosrecords(wosclient, 'DO="%s"' % doi, count=1))
+        store.add(records)
+        return records[0].uid.lstrip('WOS:') if records else None
+
     results = query(wosclient, 'DO="%s"' % doi, './REC/UID', count=1)
     return results[0].lstrip('WOS:') if results else None
+
+
+def _record_dois(record):
+    """Get the (lowercase) DOIs of a premium REC element."""
+    path = './dynamic_data/cluster_related/identifiers/identifier'
+    return set(el.get('value', '').lower() for el in record.iterfind(path)
+               if el.get('type') in ('doi', 'xref_doi'))
+
+
+def _batches(terms, batch_size, max_length, field, quote=''):
+    """Split the terms in batches whose OR'ed query on the field, with the
+    terms between quote (e.g. DO=("..." OR ...)), fits max_length."""
+    overhead = len(field) + len('=()')
+    batch, length = [], overhead
+    for term in terms:
+        size = len(term) + 2 * len(quote) + len(' OR ')
+        if batch and (len(batch) >= batch_size or length + size > max_length):
+            yield batch
+            batch, length = [], overhead
+        batch.append(term)
+        length += size
+    if batch:
+        yield batch
+
+
+def doi_to_wos_many(wosclient, dois, batch_size=50, max_length=4000,
+                    store=None):
+    """Convert many DOIs to WOS identifiers packing them in OR'ed queries
+    (of at most batch_size DOIs and max_length characters). Return the dict
+    of the resolved DOIs, the list of the unresolved DOIs and the dict of the
+    ambiguous DOIs (matching more than one record) to their WOS identifiers.
+    If a wos.store.RecordStore is given the DOIs found there are not queried,
+    and the records of the other ones are stored."""
+    if wosclient.is_lite():
+        raise NotImplementedError('Not implemented for WOS Lite')
+
+    wanted = _OrderedDict((doi.strip().lower(), doi.strip()) for doi in dois
+                          if doi.strip())
+    found = _OrderedDict()
+    if store is not None:
+        for doi in wanted:
+            uids = store.doi_to_wos(doi)
+            if len(uids) == 1:
+                found[doi] = [uids[0].lstrip('WOS:')]
+    missing = [doi for doi in wanted if doi not in found]
+    for batch in _batches(missing, batch_size, max_length, 'DO', '"'):
+        wos_query = 'DO=(%s)' % ' OR '.join('"%s"' % doi for doi in batch)
+        records = iter_records(wosclient, wos_query, _sys.maxsize)
+        if store is not None:
+            records = store.tee(records)
+        for record in records:
+            uid = record.findtext('UID').lstrip('WOS:')
+            for doi in _record_dois(record) & set(batch):
+                found.setdefault(doi, []).append(uid)
+
+    resolved, unresolved, ambiguous = _OrderedDict(), [], _OrderedDict()
+    for key, doi in wanted.items():
+        uids = found.get(key, [])
+        if len(uids) == 1:
+            resolved[doi] = uids[0]
+        elif uids:
+            ambiguous[doi] = uids
+        else:
+            unresolved.append(doi)
+    return resolved, unresolved, ambiguous
+
+
+def _uid_key(uid):
+    """Normalize the UID to match it with or without the WOS: prefix."""
+    return uid.strip().upper().split(':', 1)[-1]
+
+
+def _retrieve_batch(wosclient, uids, fields, search, max_length):
+    """Get the WosRecords of the UIDs, with retrieveById or (if search is
+    True or the service refuses the batch) with UT=(... OR ...) searches.
+    Return the records by UID key and whether the search was used."""
+    found = {}
+    if not search:
+        import suds
+        try:
+            result = wosclient.retrieveById(uids, len(uids))
+        except suds.WebFault:
+            if len(uids) == 1:
+                raise
+            search = True
+        else:
+            records = _get_records(wosclient, result)
+            if records is not None and len(records):
+                found.update(
+                    (_uid_key(record.uid), record) for record in
+                    _iter_page_wosrecords(wosclient, records, fields))
+    if search:
+        for batch in _batches(uids, len(uids), max_length, 'UT'):
+            wos_query = 'UT=(%s)' % ' OR '.join(batch)
+            found.update((_uid_key(record.uid), record) for record in
+                         iter_wosrecords(wosclient, wos_query, _sys.maxsize,
+                                         fields=fields))
+    return found, search
+
+
+def retrieve_by_ids(wosclient, uids, batch=100, fields=_FIELDS, search=False,
+                    max_length=4000):
+    """Retrieve the records of many UIDs packing them in retrieveById
+    requests of batch UIDs (at most 100, the limit of the service) or in
+    UT=(... OR ...) searches of at most max_length characters (if search is
+    True or once the service refuses a batch) and yield the (uid, WosRecord)
+    pairs in the order of the input UIDs, with None as the record of the
+    UIDs not found (or empty). The records are streamed one batch at a time
+    (see wos.records for the fields)."""
+    batch = min(batch, 100)
+    pending, keys = [], _OrderedDict()
+    for uid in _chain(uids, [_DONE]):
+        if uid is not _DONE:
+            pending.append(uid)
+            if uid:
+                keys.setdefault(_uid_key(uid), uid)
+            if len(keys) < batch:
+                continue
+        found = {}
+        if keys:
+            found, search = _retrieve_batch(wosclient, list(keys.values()),
+                                            fields, search, max_length)
+        for uid in pending:
+            yield uid, found.get(_uid_key(uid)) if uid else None
+        pending, keys = [], _OrderedDict()